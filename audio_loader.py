@@ -0,0 +1,119 @@
+"""
+Chargement audio unique partagé par Whisper et pyannote
+Décode une seule fois via ffmpeg en float32 mono 16 kHz, avec un cache
+disque mappé en mémoire pour les gros fichiers
+"""
+
+import hashlib
+import os
+import subprocess
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+
+# Lecture de la sortie ffmpeg par blocs (~1 s de PCM 16 bits)
+CHUNK_BYTES = SAMPLE_RATE * 2 * 1
+
+
+def _ffmpeg_command(filepath):
+    return [
+        # Erreurs seules sur stderr: ni bannière ni progression
+        "ffmpeg", "-nostdin", "-nostats", "-loglevel", "error", "-threads", "0",
+        "-i", str(filepath),
+        "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(SAMPLE_RATE),
+        "-",
+    ]
+
+
+def _decode_chunks(filepath):
+    """Produit des blocs float32 au fil du décodage ffmpeg"""
+    # stderr dans un fichier: un tube lu seulement à la fin pourrait se remplir
+    # (erreurs de décodage répétées) et bloquer ffmpeg, donc la lecture de stdout
+    errors = tempfile.TemporaryFile()
+    process = subprocess.Popen(_ffmpeg_command(filepath), stdout=subprocess.PIPE, stderr=errors)
+    pending = b""
+    try:
+        while True:
+            data = process.stdout.read(CHUNK_BYTES)
+            if not data:
+                break
+            data = pending + data
+            usable = len(data) - len(data) % 2
+            pending = data[usable:]
+            yield np.frombuffer(data[:usable], np.int16).astype(np.float32) / 32768.0
+    finally:
+        process.stdout.close()
+        returncode = process.wait()
+        errors.seek(0)
+        stderr = errors.read()
+        errors.close()
+        if returncode != 0:
+            raise RuntimeError(f"Échec du décodage audio: {stderr.decode(errors='ignore')}")
+
+
+def _cache_key(filepath):
+    """Identifie un fichier par son chemin, sa taille et sa date de modification"""
+    stat = os.stat(filepath)
+    key = f"{os.path.abspath(filepath)}|{stat.st_size}|{stat.st_mtime_ns}"
+    return hashlib.sha256(key.encode()).hexdigest()[:32]
+
+
+def _prune_cache(cache_dir, max_bytes):
+    """Supprime les buffers les moins récemment utilisés au-delà du budget disque"""
+    files = sorted(Path(cache_dir).glob("*.f32"), key=lambda p: p.stat().st_atime)
+    total = sum(p.stat().st_size for p in files)
+    for path in files:
+        if total <= max_bytes:
+            break
+        total -= path.stat().st_size
+        path.unlink(missing_ok=True)
+
+
+def load_audio(filepath, cache_dir=None, mmap_threshold=100 * 1024 * 1024, max_cache_bytes=20 * 1024 ** 3):
+    """
+    Décode `filepath` en float32 mono 16 kHz.
+
+    Les fichiers plus gros que `mmap_threshold` sont décodés en flux vers un
+    fichier de cache de `cache_dir` puis mappés en mémoire (copie sur écriture),
+    sans jamais matérialiser tout le PCM brut en RAM.
+    """
+    if cache_dir is None or os.path.getsize(filepath) < mmap_threshold:
+        chunks = list(_decode_chunks(filepath))
+        return np.concatenate(chunks) if chunks else np.zeros(0, np.float32)
+
+    Path(cache_dir).mkdir(parents=True, exist_ok=True)
+    cache_path = Path(cache_dir) / f"{_cache_key(filepath)}.f32"
+
+    if not cache_path.exists():
+        print(f"💾 Décodage en cache: {cache_path}")
+        tmp_path = cache_path.with_suffix(f".tmp{os.getpid()}")
+        try:
+            with open(tmp_path, "wb") as f:
+                for chunk in _decode_chunks(filepath):
+                    f.write(chunk.tobytes())
+            os.replace(tmp_path, cache_path)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+        _prune_cache(cache_dir, max_cache_bytes)
+    else:
+        # Rafraîchit la date d'accès pour l'éviction LRU
+        os.utime(cache_path)
+
+    if cache_path.stat().st_size == 0:
+        return np.zeros(0, np.float32)
+    return np.memmap(cache_path, dtype=np.float32, mode="c")
+
+
+def duration(audio):
+    """Durée en secondes d'un buffer décodé"""
+    return len(audio) / SAMPLE_RATE
+
+
+def to_pyannote(audio):
+    """Entrée en mémoire pour pyannote: {"waveform": (canal, temps), "sample_rate"}"""
+    import torch
+
+    return {"waveform": torch.from_numpy(np.asarray(audio)).unsqueeze(0), "sample_rate": SAMPLE_RATE}
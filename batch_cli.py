@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Traitement par lots sans Flask
+Transcrit et diarise un dossier (ou un manifeste) avec un pool de processus
+détenant chacun ses modèles; les résultats sont écrits au fil de l'eau en
+JSONL et une reprise après interruption saute les fichiers déjà traités
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+AUDIO_EXTENSIONS = (".m4a", ".wav", ".mp3", ".mp4", ".flac", ".ogg", ".webm")
+
+
+def list_inputs(source, recursive=False, extensions=AUDIO_EXTENSIONS):
+    """
+    Fichiers à traiter: contenu d'un dossier, ou manifeste (.txt: un chemin
+    par ligne, .jsonl: objets avec un champ "path"), chemins relatifs au manifeste.
+    """
+    source = Path(source)
+    if source.is_dir():
+        pattern = "**/*" if recursive else "*"
+        return sorted(
+            str(path.resolve()) for path in source.glob(pattern)
+            if path.is_file() and path.suffix.lower() in extensions
+        )
+
+    paths = []
+    for line in source.read_text(encoding="utf-8").splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        path = json.loads(line)["path"] if source.suffix == ".jsonl" else line
+        paths.append(str((source.parent / path).resolve()))
+    return paths
+
+
+def completed_files(output):
+    """Fichiers déjà traités avec succès d'après un JSONL existant (reprise)"""
+    done = set()
+    if not Path(output).exists():
+        return done
+    with open(output, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Dernière ligne tronquée par un arrêt brutal
+                continue
+            if record.get("success"):
+                done.add(record["file"])
+    return done
+
+
+# --- Côté worker: un registre de modèles par processus ---
+
+_worker = {}
+
+
+def _init_worker(config):
+    import torch
+
+    from language_policy import LanguagePolicy
+    from model_registry import ModelRegistry
+
+    torch.set_num_threads(config["threads"])
+    loaders = {}
+    if config["stub"]:
+        from stub_models import StubDiarization, StubWhisper
+        loaders = {"whisper_loader": lambda *args: StubWhisper(), "diarization_loader": StubDiarization}
+    _worker["models"] = ModelRegistry(
+        default_whisper=config["model"],
+        allowed_sizes=(config["model"],),
+        quantize=config["quantize"],
+        hf_token=config["hf_token"],
+        ttl=0,
+        **loaders,
+    )
+    _worker["language_policy"] = LanguagePolicy.from_env()
+    _worker["config"] = config
+    print(f"🧩 Worker {os.getpid()} prêt ({config['threads']} threads)", file=sys.stderr)
+
+
+def _process_file(filepath):
+    """Traite un fichier; les erreurs sont renvoyées dans l'enregistrement"""
+    import contextlib
+    import io
+
+    from pipeline import run_pipeline
+
+    models = _worker["models"]
+    config = _worker["config"]
+    t0 = time.perf_counter()
+    try:
+        # Les messages du pipeline resteraient illisibles entremêlés entre workers
+        with contextlib.redirect_stdout(io.StringIO()):
+            with models.whisper() as whisper_model, models.diarization() as diarization_pipeline:
+                result = run_pipeline(
+                    filepath, whisper_model, diarization_pipeline,
+                    audio_cache=config["audio_cache"],
+                    language_policy=_worker["language_policy"],
+                    parallel=config["parallel"],
+                    word_speakers=config["word_speakers"],
+                )
+        result["model"] = models.whisper_key()
+        return {
+            "file": filepath,
+            "success": True,
+            "audio_seconds": result["timings"]["audio_seconds"],
+            "seconds": round(time.perf_counter() - t0, 3),
+            "result": result,
+        }
+    except Exception as e:
+        return {
+            "file": filepath,
+            "success": False,
+            "error": f"{type(e).__name__}: {e}",
+            "seconds": round(time.perf_counter() - t0, 3),
+        }
+
+
+def _hours(seconds):
+    return seconds / 3600
+
+
+def run_batch(files, output, workers, config, max_pending=None):
+    """Soumet les fichiers au pool et ajoute chaque résultat au JSONL dès qu'il arrive"""
+    max_pending = max_pending or 2 * workers
+    stats = {"done": 0, "failed": 0, "audio_seconds": 0.0}
+    wall_start = time.perf_counter()
+
+    executor = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(config,),
+    )
+    remaining = iter(files)
+    pending = set()
+    with executor, open(output, "a", encoding="utf-8") as out:
+        while True:
+            # File bornée: on ne sérialise pas des milliers de tâches d'avance
+            for filepath in remaining:
+                pending.add(executor.submit(_process_file, filepath))
+                if len(pending) >= max_pending:
+                    break
+            if not pending:
+                break
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                record = future.result()
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+
+                if record["success"]:
+                    stats["done"] += 1
+                    stats["audio_seconds"] += record["audio_seconds"]
+                    status = f"✅ {record['audio_seconds'] / 60:6.1f} min en {record['seconds']:7.1f} s"
+                else:
+                    stats["failed"] += 1
+                    # Le détail complet (sortie ffmpeg...) reste dans le JSONL
+                    status = f"❌ {record['error'].strip().splitlines()[-1]}"
+                elapsed = time.perf_counter() - wall_start
+                throughput = _hours(stats["audio_seconds"]) / max(_hours(elapsed), 1e-9)
+                print(
+                    f"[{stats['done'] + stats['failed']}/{len(files)}] {status} | {Path(record['file']).name}"
+                    f" | {throughput:.1f} h audio / h"
+                )
+
+    stats["wall_seconds"] = time.perf_counter() - wall_start
+    return stats
+
+
+def main():
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+    except ImportError:
+        pass
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="Dossier de fichiers audio ou manifeste (.txt / .jsonl)")
+    parser.add_argument("-o", "--output", default="results.jsonl", help="Résultats JSONL (défaut: results.jsonl)")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="Processus, chacun avec ses modèles")
+    parser.add_argument("--threads", type=int, help="Threads torch par worker (défaut: cœurs / workers)")
+    parser.add_argument("--model", default=os.environ.get("WHISPER_MODEL", "large-v3"))
+    parser.add_argument("--quantize", action="store_true", help="Variante int8 (CPU)")
+    parser.add_argument("--recursive", action="store_true", help="Parcourt les sous-dossiers")
+    parser.add_argument("--parallel-stages", action="store_true", help="Transcription et diarisation simultanées")
+    parser.add_argument("--word-speakers", action="store_true", help="Attribution des locuteurs mot à mot")
+    parser.add_argument("--audio-cache", default=os.path.join("cache", "audio"))
+    parser.add_argument("--no-resume", action="store_true", help="Retraite aussi les fichiers déjà présents")
+    parser.add_argument("--stub", action="store_true", help="Modèles factices (test, sans réseau ni token)")
+    args = parser.parse_args()
+
+    files = list_inputs(args.source, recursive=args.recursive)
+    if not args.no_resume:
+        done = completed_files(args.output)
+        skipped = len(files)
+        files = [f for f in files if f not in done]
+        skipped -= len(files)
+        if skipped:
+            print(f"⏭️ {skipped} fichier(s) déjà traité(s) dans {args.output}")
+    if not files:
+        print("Rien à traiter")
+        return
+
+    workers = max(1, min(args.workers, len(files)))
+    config = {
+        "model": args.model,
+        "quantize": args.quantize,
+        "hf_token": os.environ.get("HF_AUTH_TOKEN"),
+        "threads": args.threads or max(1, (os.cpu_count() or 1) // workers),
+        "audio_cache": args.audio_cache,
+        "parallel": args.parallel_stages,
+        "word_speakers": args.word_speakers,
+        "stub": args.stub,
+    }
+    if not config["hf_token"] and not args.stub:
+        print("❌ Pas de token HF (diarisation désactivée)")
+    print(f"📦 {len(files)} fichier(s), {workers} worker(s), modèle {args.model} → {args.output}")
+
+    stats = run_batch(files, args.output, workers, config)
+    throughput = _hours(stats["audio_seconds"]) / max(_hours(stats["wall_seconds"]), 1e-9)
+    print(
+        f"📊 {stats['done']} réussi(s), {stats['failed']} échec(s) | "
+        f"{_hours(stats['audio_seconds']):.2f} h d'audio en {_hours(stats['wall_seconds']):.2f} h "
+        f"→ {throughput:.1f} h d'audio par heure"
+    )
+    if stats["failed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Benchmark de la transcription par morceaux
+Compare l'appel unique whisper_model.transcribe au ChunkedTranscriber
+pour plusieurs nombres de processus sur un même fichier
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from audio_loader import duration, load_audio
+from chunked_transcribe import ChunkedTranscriber
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("audio", help="Fichier audio (idéalement plusieurs dizaines de minutes)")
+    parser.add_argument("--model", default="base", help="Modèle Whisper (défaut: base)")
+    parser.add_argument("--language", default="fr")
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4])
+    parser.add_argument("--chunk-seconds", type=int, default=300)
+    parser.add_argument("--skip-single", action="store_true", help="Ne pas mesurer l'appel unique")
+    args = parser.parse_args()
+
+    import whisper
+
+    audio = load_audio(args.audio)
+    seconds = duration(audio)
+    print(f"📊 {args.audio}: {seconds / 60:.1f} min, modèle {args.model}")
+
+    baseline = None
+    if not args.skip_single:
+        model = whisper.load_model(args.model, device="cpu")
+        t0 = time.perf_counter()
+        result = model.transcribe(audio, language=args.language)
+        baseline = time.perf_counter() - t0
+        print(f"   appel unique    | {baseline:8.1f} s | RTF {baseline / seconds:.3f} | {len(result['segments'])} segments")
+        del model
+
+    for workers in args.workers:
+        transcriber = ChunkedTranscriber(
+            args.model, workers=workers, chunk_seconds=args.chunk_seconds, min_seconds=0
+        )
+        # Préchauffage: le chargement des modèles n'entre pas dans la mesure
+        warmup = [
+            transcriber._pool().submit(np.zeros, 1) for _ in range(workers)
+        ]
+        for future in warmup:
+            future.result()
+
+        t0 = time.perf_counter()
+        result = transcriber.transcribe(audio, language=args.language)
+        elapsed = time.perf_counter() - t0
+        transcriber.shutdown()
+
+        line = f"   {workers:2d} processus     | {elapsed:8.1f} s | RTF {elapsed / seconds:.3f} | {len(result['segments'])} segments"
+        if baseline:
+            line += f" | x{baseline / elapsed:.2f} (efficacité {baseline / elapsed / workers:.0%})"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Benchmark de la fusion transcription / diarisation
+Compare le moteur vectorisé (speaker_merge) au balayage imbriqué historique
+sur des jeux synthétiques de 10k à 1M tours / segments; avec --words, mesure
+l'attribution mot à mot (coût et précision face à l'attribution par segment)
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from speaker_merge import SpeakerTurns, assign_speakers, assign_words
+
+
+def make_turns(n_turns, num_speakers=4, overlap_prob=0.1, seed=0):
+    """Tours de parole synthétiques, avec une part de parole superposée"""
+    rng = np.random.default_rng(seed)
+    durations = rng.uniform(0.5, 8.0, n_turns)
+    gaps = rng.uniform(0.0, 0.5, n_turns)
+    starts = np.cumsum(durations + gaps) - durations
+    ends = starts + durations
+    speakers = rng.integers(0, num_speakers, n_turns)
+
+    # Certains tours débordent sur le suivant (parole superposée)
+    overlapping = rng.random(n_turns) < overlap_prob
+    ends = np.where(overlapping, ends + rng.uniform(0.5, 2.0, n_turns), ends)
+
+    names = [f"SPEAKER_{k:02d}" for k in speakers]
+    return starts, ends, names
+
+
+def make_segments(n_segments, total_duration, seed=1):
+    """Segments Whisper synthétiques contigus couvrant toute la durée"""
+    rng = np.random.default_rng(seed)
+    bounds = np.sort(rng.uniform(0.0, total_duration, n_segments + 1))
+    return bounds[:-1], bounds[1:]
+
+
+def legacy_assign(turn_list, seg_starts, seg_ends):
+    """Reproduction du balayage imbriqué de process_audio (O(segments x tours))"""
+    labels = []
+    for seg_start, seg_end in zip(seg_starts, seg_ends):
+        speaker_label = "Locuteur_Inconnu"
+        for start, end, speaker in turn_list:
+            if start <= seg_start <= end or start <= seg_end <= end:
+                speaker_label = speaker
+                break
+        labels.append(speaker_label)
+    return labels
+
+
+def run(size, legacy_max):
+    starts, ends, names = make_turns(size)
+    seg_starts, seg_ends = make_segments(size, float(ends.max()))
+
+    t0 = time.perf_counter()
+    turns = SpeakerTurns.from_lists(starts, ends, names)
+    t1 = time.perf_counter()
+    assignment = assign_speakers(turns, seg_starts, seg_ends)
+    t2 = time.perf_counter()
+
+    line = (
+        f"{size:>9,} | build {1000 * (t1 - t0):9.1f} ms | assign {1000 * (t2 - t1):9.1f} ms"
+        f" | superposés {int((assignment['overlapping'] > 1).sum()):>7,}"
+    )
+
+    if size <= legacy_max:
+        turn_list = list(zip(starts, ends, names))
+        t3 = time.perf_counter()
+        legacy_assign(turn_list, seg_starts, seg_ends)
+        t4 = time.perf_counter()
+        legacy_ms = 1000 * (t4 - t3)
+        speedup = legacy_ms / max(1000 * (t2 - t0), 1e-9)
+        line += f" | historique {legacy_ms:10.1f} ms (x{speedup:,.0f})"
+
+    print(line)
+
+
+def make_conversation(n_words, num_speakers=3, words_per_segment=12, jitter=0.3, seed=2):
+    """
+    Conversation synthétique: mots de ~0.35 s, tours de 2 à 20 mots, segments
+    Whisper de taille fixe qui ignorent les changements de locuteur. La
+    diarisation est la vérité terrain avec des bornes décalées de ±`jitter` s.
+    """
+    rng = np.random.default_rng(seed)
+    lengths = rng.uniform(0.15, 0.55, n_words)
+    gaps = rng.uniform(0.0, 0.15, n_words)
+    word_starts = np.cumsum(lengths + gaps) - lengths
+    word_ends = word_starts + lengths
+
+    # Vérité terrain: le locuteur change tous les 2 à 20 mots
+    turn_first = np.cumsum(rng.integers(2, 21, n_words))
+    turn_first = np.concatenate(([0], turn_first[turn_first < n_words]))
+    turn_speakers = rng.integers(0, num_speakers, len(turn_first))
+
+    turn_last = np.append(turn_first[1:], n_words) - 1
+    starts = word_starts[turn_first] + rng.uniform(-jitter, jitter, len(turn_first))
+    ends = word_ends[turn_last] + rng.uniform(-jitter, jitter, len(turn_first))
+    names = [f"SPEAKER_{k:02d}" for k in turn_speakers]
+    turns = SpeakerTurns.from_lists(starts, ends, names)
+
+    # Locuteur réel de chaque mot, en indice de turns.labels
+    index = {label: i for i, label in enumerate(turns.labels)}
+    turn_ids = np.asarray([index[name] for name in names])
+    truth = np.repeat(turn_ids, np.diff(np.append(turn_first, n_words)))
+
+    segment_ids = np.arange(n_words) // words_per_segment
+    return turns, word_starts, word_ends, segment_ids, truth
+
+
+def run_words(n_words):
+    turns, word_starts, word_ends, segment_ids, truth = make_conversation(n_words)
+
+    # Attribution par segment: tous les mots d'un segment reçoivent son locuteur
+    bounds = np.flatnonzero(np.diff(segment_ids)) + 1
+    seg_starts = word_starts[np.concatenate(([0], bounds))]
+    seg_ends = word_ends[np.append(bounds, n_words) - 1]
+    t0 = time.perf_counter()
+    by_segment = assign_speakers(turns, seg_starts, seg_ends)["speaker_ids"][segment_ids]
+    t1 = time.perf_counter()
+    alignment = assign_words(turns, word_starts, word_ends, segment_ids)
+    t2 = time.perf_counter()
+
+    hours = word_ends[-1] / 3600
+    print(
+        f"{n_words:>9,} mots ({hours:6.1f} h) | segments {1000 * (t1 - t0):7.1f} ms"
+        f" | mots {1000 * (t2 - t1):7.1f} ms ({1000 * (t2 - t1) / hours:5.1f} ms/h d'audio)"
+        f" | précision {np.mean(by_segment == truth):6.1%} → {np.mean(alignment['speaker_ids'] == truth):6.1%}"
+        f" | {len(alignment['run_starts']):,} segments après découpage"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument(
+        "--legacy-max", type=int, default=10_000,
+        help="Taille maximale pour laquelle mesurer le balayage historique (quadratique)",
+    )
+    parser.add_argument(
+        "--words", type=int, nargs="*",
+        help="Attribution mot à mot sur N mots (défaut: 100k, 1M)",
+    )
+    args = parser.parse_args()
+
+    if args.words is not None:
+        print("📊 Attribution mot à mot vs par segment (segments de 12 mots, 3 locuteurs)")
+        for n_words in args.words or [100_000, 1_000_000]:
+            run_words(n_words)
+        return
+
+    print("📊 Fusion locuteurs: tours = segments = N")
+    for size in args.sizes:
+        run(size, args.legacy_max)
+
+
+if __name__ == "__main__":
+    main()
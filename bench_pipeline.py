@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Benchmark hors ligne du pipeline complet
+Mesure chaque étape (réception, décodage, transcription, diarisation, fusion,
+analyse par locuteur, sérialisation JSON) avec les modèles factices de
+stub_models, pour plusieurs durées d'audio et nombres de locuteurs.
+Fonctionne sur CPU, sans réseau ni token; les résultats sont enregistrés en
+JSON pour servir de référence et détecter les régressions
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import wave
+from pathlib import Path
+
+import numpy as np
+from werkzeug.datastructures import FileStorage
+
+from audio_loader import SAMPLE_RATE
+from language_policy import LanguagePolicy
+from pipeline import run_pipeline
+from stub_models import StubDiarization, StubWhisper
+from upload_ingest import UploadStore
+
+BASELINE_FORMAT = 1
+
+STAGES = ("upload", "decode", "transcribe", "diarize", "merge", "speaker_analysis", "serialize")
+
+
+def make_wav(path, seconds, seed=0):
+    """WAV 16 kHz mono: rafales de bruit façon parole séparées de silences"""
+    rng = np.random.default_rng(seed)
+    block = 60 * SAMPLE_RATE
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        remaining = int(seconds * SAMPLE_RATE)
+        while remaining > 0:
+            n = min(block, remaining)
+            envelope = np.repeat(rng.random(n // SAMPLE_RATE + 1) < 0.8, SAMPLE_RATE)[:n]
+            samples = rng.normal(0, 3000, n) * envelope
+            f.writeframes(samples.astype(np.int16).tobytes())
+            remaining -= n
+
+
+def run_once(wav_path, store, audio_cache, speakers, rtf, word_speakers=False):
+    """Un passage complet; retourne (durées par étape, résultat)"""
+    timings = {}
+    with open(wav_path, "rb") as f:
+        t0 = time.perf_counter()
+        upload = store.adopt(FileStorage(stream=f, filename=wav_path.name))
+        timings["upload"] = time.perf_counter() - t0
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = run_pipeline(
+            upload.path,
+            StubWhisper(rtf=rtf),
+            StubDiarization(num_speakers=speakers, rtf=rtf),
+            audio_cache=audio_cache,
+            language_policy=LanguagePolicy(),
+            word_speakers=word_speakers,
+        )
+    for stage in ("decode", "transcribe", "diarize", "merge", "speaker_analysis"):
+        timings[stage] = result["timings"][stage]
+
+    t0 = time.perf_counter()
+    json.dumps({"success": True, **result}, ensure_ascii=False)
+    timings["serialize"] = time.perf_counter() - t0
+
+    store.release(upload)
+    Path(upload.path).unlink(missing_ok=True)
+    return timings, result
+
+
+def run_case(workdir, seconds, speakers, repeats, rtf, word_speakers=False):
+    wav_path = Path(workdir) / f"bench_{seconds}s.wav"
+    if not wav_path.exists():
+        make_wav(wav_path, seconds)
+    store = UploadStore(Path(workdir) / "uploads", max_file_bytes=0)
+    audio_cache = str(Path(workdir) / "audio")
+
+    runs = []
+    for _ in range(repeats):
+        timings, result = run_once(wav_path, store, audio_cache, speakers, rtf, word_speakers)
+        runs.append(timings)
+
+    # Médiane de chaque étape sur les répétitions
+    stages = {stage: round(statistics.median(run[stage] for run in runs), 4) for stage in STAGES}
+    total = sum(stages.values())
+    return {
+        "audio_seconds": seconds,
+        "speakers": speakers,
+        "segments": len(result["segments"]["start"]),
+        "detected_speakers": len(result["speakers"]),
+        "stages": stages,
+        "total": round(total, 4),
+        "rtf": round(total / seconds, 5),
+    }
+
+
+def machine_info():
+    return {
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def mismatched_settings(report, baseline):
+    """
+    Paramètres (rtf, word_speakers) et nombre de cœurs différents entre la
+    référence et cette mesure: les durées ne sont alors pas comparables
+    """
+    current = {**report["settings"], "cpu_count": report["machine"]["cpu_count"]}
+    # Références antérieures à --word-speakers: mesurées sans
+    recorded = {"word_speakers": False, **baseline.get("settings", {}), "cpu_count": baseline.get("machine", {}).get("cpu_count")}
+    return [
+        (name, recorded.get(name), value) for name, value in current.items()
+        if name != "repeats" and recorded.get(name) != value
+    ]
+
+
+def compare(cases, baseline, tolerance, min_seconds):
+    """Étapes plus lentes que la référence de plus de `tolerance` (et de `min_seconds`)"""
+    reference = {(c["audio_seconds"], c["speakers"]): c for c in baseline["cases"]}
+    regressions = []
+    for case in cases:
+        ref = reference.get((case["audio_seconds"], case["speakers"]))
+        if ref is None:
+            continue
+        for stage, seconds in case["stages"].items():
+            before = ref["stages"].get(stage)
+            if before is None:
+                continue
+            if seconds > before * (1 + tolerance) and seconds - before > min_seconds:
+                regressions.append((case["audio_seconds"], case["speakers"], stage, before, seconds))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--durations", type=int, nargs="+", default=[60, 600, 3600], help="Durées d'audio (s)")
+    parser.add_argument("--speakers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument(
+        "--rtf", type=float, default=0.0,
+        help="Temps de calcul simulé des modèles factices (0 = mesure le pipeline seul)",
+    )
+    parser.add_argument(
+        "--word-speakers", action="store_true", help="Attribution mot à mot et découpage aux changements de locuteur",
+    )
+    parser.add_argument("--output", help="Écrit les résultats en JSON (nouvelle référence)")
+    parser.add_argument("--compare", help="Compare à une référence JSON (code de sortie 1 si régression)")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="Ralentissement toléré (0.5 = +50 %%)")
+    parser.add_argument("--min-ms", type=float, default=5.0, help="Écart absolu ignoré (bruit de mesure)")
+    parser.add_argument(
+        "--force", action="store_true",
+        help="Compare même si les paramètres ou le nombre de cœurs diffèrent de la référence",
+    )
+    parser.add_argument("--workdir", help="Dossier des fichiers générés (défaut: temporaire)")
+    args = parser.parse_args()
+
+    header = " | ".join(f"{stage[:10]:>10}" for stage in STAGES)
+    print(f"📊 Pipeline avec modèles factices ({args.repeats} répétitions, médiane en ms)")
+    print(f"   durée | loc. | segments | {header} |    RTF")
+
+    cases = []
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = args.workdir or tmp
+        # Préchauffage: imports paresseux (torch, whisper) hors mesure
+        run_case(workdir, 10, 2, 1, 0.0)
+        for seconds in args.durations:
+            for speakers in args.speakers:
+                case = run_case(workdir, seconds, speakers, args.repeats, args.rtf, args.word_speakers)
+                cases.append(case)
+                row = " | ".join(f"{1000 * case['stages'][stage]:10.1f}" for stage in STAGES)
+                print(f"  {seconds:>6} | {speakers:>4} | {case['segments']:>8} | {row} | {case['rtf']:.4f}")
+
+    report = {
+        "format": BASELINE_FORMAT,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": machine_info(),
+        "settings": {"repeats": args.repeats, "rtf": args.rtf, "word_speakers": args.word_speakers},
+        "cases": cases,
+    }
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(json.dumps(report, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+        print(f"💾 Référence écrite: {args.output}")
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        mismatches = mismatched_settings(report, baseline)
+        if mismatches:
+            print(f"{'⚠️' if args.force else '❌'} Mesure non comparable à {args.compare}:")
+            for name, before, after in mismatches:
+                print(f"   {name}: {before} dans la référence, {after} ici")
+            if not args.force:
+                print("   Relancez avec les mêmes paramètres, enregistrez une nouvelle référence (--output) ou forcez (--force)")
+                sys.exit(2)
+        regressions = compare(cases, baseline, args.tolerance, args.min_ms / 1000)
+        if regressions:
+            print(f"❌ {len(regressions)} régression(s) par rapport à {args.compare}:")
+            for seconds, speakers, stage, before, after in regressions:
+                print(f"   {seconds} s / {speakers} loc. / {stage}: {1000 * before:.1f} → {1000 * after:.1f} ms")
+            sys.exit(1)
+        print(f"✅ Aucune régression par rapport à {args.compare}")
+
+
+if __name__ == "__main__":
+    main()
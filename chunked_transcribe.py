@@ -0,0 +1,174 @@
+"""
+Transcription parallèle des enregistrements longs
+L'audio est découpé aux silences, chaque
+morceau est transcrit par un processus disposant de son propre modèle Whisper,
+puis les segments sont recollés avec des timestamps absolus
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from audio_loader import SAMPLE_RATE
+
+# Trames de 100 ms pour le calcul d'énergie
+FRAME_SAMPLES = SAMPLE_RATE // 10
+
+
+def _frame_energy(audio):
+    """Énergie RMS par trame de 100 ms (vectorisé)"""
+    n_frames = len(audio) // FRAME_SAMPLES
+    frames = np.asarray(audio[:n_frames * FRAME_SAMPLES]).reshape(n_frames, FRAME_SAMPLES)
+    return np.sqrt(np.mean(frames ** 2, axis=1))
+
+
+def find_split_points(audio, chunk_seconds=300, search_seconds=15):
+    """
+    Points de coupe (en échantillons) proches de chaque multiple de `chunk_seconds`:
+    centre de la trame la plus silencieuse dans une fenêtre de ±`search_seconds`.
+    La diarisation n'est pas encore disponible quand la transcription démarre,
+    d'où une coupe aux silences seulement.
+    """
+    total = len(audio)
+    targets = np.arange(chunk_seconds, total / SAMPLE_RATE - chunk_seconds / 4, chunk_seconds)
+    if len(targets) == 0:
+        return []
+
+    energy = _frame_energy(audio)
+    radius = int(search_seconds * SAMPLE_RATE / FRAME_SAMPLES)
+    samples = []
+    for target in targets:
+        center = int(target * SAMPLE_RATE / FRAME_SAMPLES)
+        lo, hi = max(center - radius, 0), min(center + radius + 1, len(energy))
+        quietest = lo + int(np.argmin(energy[lo:hi]))
+        samples.append(quietest * FRAME_SAMPLES + FRAME_SAMPLES // 2)
+
+    return sorted(set(int(s) for s in samples if 0 < s < total))
+
+
+def plan_chunks(audio, split_points, overlap_seconds=1.0):
+    """
+    Morceaux (début, fin, coupe_gauche, coupe_droite) en échantillons.
+    Chaque morceau déborde de `overlap_seconds` sur ses voisins; les coupes
+    servent à dédupliquer les segments de la zone de recouvrement.
+    """
+    overlap = int(overlap_seconds * SAMPLE_RATE)
+    cuts = [0] + list(split_points) + [len(audio)]
+    return [
+        (max(left - overlap, 0), min(right + overlap, len(audio)), left, right)
+        for left, right in zip(cuts[:-1], cuts[1:])
+    ]
+
+
+def stitch(chunk_results):
+    """
+    Recolle les segments de chaque morceau: on ne garde un segment que si son
+    milieu tombe entre les coupes du morceau qui l'a produit.
+    """
+    segments = []
+    for (left, right), chunk_segments in chunk_results:
+        for seg in chunk_segments:
+            middle = (seg["start"] + seg["end"]) / 2 * SAMPLE_RATE
+            if left <= middle < right:
+                segments.append(seg)
+    segments.sort(key=lambda seg: seg["start"])
+    for i, seg in enumerate(segments):
+        seg["id"] = i
+    return segments
+
+
+# --- Côté worker: un modèle par processus ---
+
+_worker_model = None
+
+
+def _init_worker(model_name, quantize, threads):
+    global _worker_model
+    import torch
+
+    from model_registry import load_whisper
+
+    torch.set_num_threads(threads)
+    _worker_model = load_whisper(model_name, device="cpu", quantize=quantize)
+    print(f"🧩 Worker {os.getpid()}: modèle {model_name} chargé ({threads} threads)")
+
+
+def _transcribe_chunk(chunk, offset_seconds, language, options):
+    """Transcrit un morceau et décale ses timestamps à la position absolue"""
+    result = _worker_model.transcribe(chunk, language=language, **options)
+    segments = []
+    for seg in result["segments"]:
+        seg = dict(seg, start=seg["start"] + offset_seconds, end=seg["end"] + offset_seconds)
+        if "words" in seg:
+            seg["words"] = [
+                dict(w, start=w["start"] + offset_seconds, end=w["end"] + offset_seconds)
+                for w in seg["words"]
+            ]
+        segments.append(seg)
+    return segments
+
+
+class ChunkedTranscriber:
+    """
+    Pool de `workers` processus détenant chacun un modèle Whisper.
+    Le pool est créé au premier appel puis réutilisé entre les requêtes.
+    """
+
+    def __init__(
+        self, model_name, workers=None, chunk_seconds=300, overlap_seconds=1.0, min_seconds=600, quantize=False,
+    ):
+        self.model_name = model_name
+        self.quantize = quantize
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_seconds = chunk_seconds
+        self.overlap_seconds = overlap_seconds
+        self.min_seconds = min_seconds
+        self._executor = None
+
+    def settings(self):
+        """Paramètres qui influencent le résultat (clé de cache)"""
+        return {"chunk_seconds": self.chunk_seconds, "overlap_seconds": self.overlap_seconds, "min_seconds": self.min_seconds}
+
+    def applies_to(self, audio):
+        return len(audio) / SAMPLE_RATE >= self.min_seconds
+
+    def _pool(self):
+        if self._executor is None:
+            threads = max(1, (os.cpu_count() or 1) // self.workers)
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.model_name, self.quantize, threads),
+            )
+        return self._executor
+
+    def transcribe(self, audio, language=None, **options):
+        """Même format de retour que whisper_model.transcribe"""
+        split_points = find_split_points(audio, self.chunk_seconds)
+        chunks = plan_chunks(audio, split_points, self.overlap_seconds)
+        print(f"🧩 Transcription en {len(chunks)} morceaux sur {self.workers} processus")
+
+        pool = self._pool()
+        futures = [
+            (
+                (left, right),
+                pool.submit(
+                    _transcribe_chunk, np.array(audio[start:end]), start / SAMPLE_RATE, language, options
+                ),
+            )
+            for start, end, left, right in chunks
+        ]
+        segments = stitch([(cuts, future.result()) for cuts, future in futures])
+        return {
+            "text": "".join(seg["text"] for seg in segments),
+            "segments": segments,
+            "language": language,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
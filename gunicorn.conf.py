@@ -0,0 +1,50 @@
+"""
+Configuration gunicorn du serveur de production
+    gunicorn 'main_app:create_app()'
+
+L'application (et ses modèles, PRELOAD_MODELS=1 par défaut ici) est chargée
+une fois dans le processus maître puis forkée: les poids restent partagés en
+copie sur écriture entre les workers au lieu d'être chargés N fois. Chaque
+worker est épinglé sur sa part des cœurs avec autant de threads torch
+(WEB_WORKERS, WEB_THREADS, WEB_BIND, WEB_TIMEOUT, WORKER_PIN_CPUS)
+"""
+
+import gc
+import os
+
+from serving import pin_worker, prepare_master
+
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    pass
+
+bind = os.environ.get("WEB_BIND", "0.0.0.0:5002")
+workers = int(os.environ.get("WEB_WORKERS", 2))
+# Threads par worker: uploads, suivi des tâches, flux et WebSocket /live en parallèle
+# des traitements, eux bornés par MAX_CONCURRENT_JOBS places d'inférence par worker
+worker_class = "gthread"
+threads = int(os.environ.get("WEB_THREADS", 8))
+timeout = int(os.environ.get("WEB_TIMEOUT", 120))
+graceful_timeout = timeout
+preload_app = True
+
+# Avant le chargement de l'application: pas de pool OpenMP dans le maître
+if prepare_master():
+    os.environ.setdefault("PRELOAD_MODELS", "1")
+
+
+def pre_fork(server, worker):
+    # Objets du maître (modèles compris) exclus du ramasse-miettes: ses passages
+    # dans les workers ne réécrivent pas leurs pages partagées
+    gc.freeze()
+    # Indice du worker parmi ceux en vie: un worker relancé reprend les cœurs du disparu
+    used = {getattr(w, "cpu_index", None) for w in server.WORKERS.values()}
+    worker.cpu_index = next(i for i in range(len(server.WORKERS) + 1) if i not in used)
+
+
+def post_fork(server, worker):
+    cpus = pin_worker(worker.cpu_index, server.num_workers, affinity=os.environ.get("WORKER_PIN_CPUS", "1") == "1")
+    # Budgets de threads des étapes recalculés pour les cœurs du worker
+    server.app.wsgi().extensions["configure_threads"](len(cpus))
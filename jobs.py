@@ -0,0 +1,272 @@
+"""
+File de tâches asynchrone pour le pipeline
+Un pool borné de workers exécute les traitements; chaque tâche expose
+son étape, son pourcentage, sa position dans la file et peut être annulée.
+Avec plusieurs processus serveurs, l'état des tâches est partagé par fichiers
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import nullcontext
+from pathlib import Path
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    """Levée dans le worker quand une annulation a été demandée"""
+
+
+class QueueFull(Exception):
+    """Levée à la soumission quand la file d'attente est pleine"""
+
+
+class Job:
+    """Une demande de traitement et son état courant"""
+
+    def __init__(self, args):
+        self.id = uuid.uuid4().hex
+        self.args = args
+        self.status = QUEUED
+        self.stage = None
+        self.progress = 0.0
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_requested = threading.Event()
+        self.saved_at = 0.0
+
+    def report(self, stage, percent):
+        """Callback de progression transmis au pipeline"""
+        if self.cancel_requested.is_set():
+            raise JobCancelled(self.id)
+        self.stage = stage
+        self.progress = max(self.progress, float(percent))
+
+    def to_dict(self, position=None):
+        data = {
+            "job_id": self.id,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": round(self.progress, 1),
+            "position": position,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+        if self.status == DONE:
+            data["result"] = self.result
+        if self.status == FAILED:
+            data["error"] = self.error
+        return data
+
+
+class JobQueue:
+    """
+    Pool de `max_workers` threads consommant une file FIFO bornée.
+
+    `runner(*job.args, progress=job.report)` effectue le traitement; l'annulation
+    d'une tâche en cours prend effet au prochain appel de progression. Avec
+    `admit` (fabrique de gestionnaire de contexte, par exemple une place
+    d'inférence), la prochaine tâche reste en file, en position 1, jusqu'à
+    ce qu'un worker y soit admis, et le reste pendant tout son traitement.
+
+    Les threads démarrent à la première soumission, dans le processus qui
+    soumet (une file créée avant un fork sert donc dans chaque enfant). Avec
+    `state_dir`, l'état de chaque tâche est aussi écrit dans `<id>.json`
+    (au plus toutes les `save_interval` secondes pendant le traitement): un
+    autre processus partageant le dossier peut alors la décrire et l'annuler
+    (marqueur `<id>.cancel`).
+    """
+
+    def __init__(
+        self, runner, max_workers=1, max_queued=32, retention=3600, state_dir=None, save_interval=1.0, admit=None,
+    ):
+        self.runner = runner
+        self.admit = admit or nullcontext
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.retention = retention
+        self.state_dir = Path(state_dir) if state_dir else None
+        if self.state_dir:
+            self.state_dir.mkdir(parents=True, exist_ok=True)
+        self.save_interval = save_interval
+        self._jobs = {}
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._workers = []
+        self._workers_pid = None
+
+    def _start_workers(self):
+        # Les threads ne survivent pas à un fork: un pool par processus
+        if self._workers_pid == os.getpid():
+            return
+        self._workers_pid = os.getpid()
+        self._workers = [
+            threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            for i in range(self.max_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, *args):
+        with self._cond:
+            self._start_workers()
+            self._prune()
+            if len(self._pending) >= self.max_queued:
+                raise QueueFull(f"{len(self._pending)} tâches déjà en attente")
+            job = Job(args)
+            self._jobs[job.id] = job
+            self._pending.append(job)
+            self._save(job, len(self._pending))
+            self._cond.notify()
+            return job
+
+    def get(self, job_id):
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def _state_path(self, job_id, suffix=".json"):
+        # Identifiants hexadécimaux uniquement: pas de chemin arbitraire depuis l'URL
+        if self.state_dir is None or not job_id.isalnum():
+            return None
+        return self.state_dir / f"{job_id}{suffix}"
+
+    def _save(self, job, position=None):
+        path = self._state_path(job.id)
+        if path is None:
+            return
+        job.saved_at = time.time()
+        tmp_path = path.with_suffix(f".tmp{os.getpid()}-{threading.get_ident()}")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(job.to_dict(position), f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    def describe(self, job_id):
+        """État d'une tâche de ce processus, ou à défaut celui écrit par un autre; None si inconnue"""
+        job = self.get(job_id)
+        if job is not None:
+            return job.to_dict(self.position(job))
+        path = self._state_path(job_id)
+        if path is None:
+            return None
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def position(self, job):
+        """Position dans la file (1 = prochaine tâche lancée), None si déjà démarrée"""
+        with self._cond:
+            try:
+                return self._pending.index(job) + 1
+            except ValueError:
+                return None
+
+    def depth(self):
+        with self._cond:
+            return len(self._pending)
+
+    def cancel(self, job_id):
+        """Annule une tâche; retourne False si elle est inconnue ou déjà terminée"""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return self._cancel_remote(job_id)
+            if job.status in FINISHED_STATES:
+                return False
+            job.cancel_requested.set()
+            if job.status == QUEUED:
+                self._pending.remove(job)
+                self._finish(job, CANCELLED)
+            return True
+
+    def _cancel_remote(self, job_id):
+        """Tâche d'un autre processus: marqueur relevé à son prochain point de progression"""
+        state = self.describe(job_id)
+        if state is None or state["status"] in FINISHED_STATES:
+            return False
+        self._state_path(job_id, ".cancel").touch()
+        return True
+
+    def _cancel_marked(self, job):
+        path = self._state_path(job.id, ".cancel")
+        return path is not None and path.exists()
+
+    def _report(self, job, stage, percent):
+        if not job.cancel_requested.is_set() and self._cancel_marked(job):
+            job.cancel_requested.set()
+        job.report(stage, percent)
+        if self.state_dir and time.time() - job.saved_at >= self.save_interval:
+            self._save(job)
+
+    def _finish(self, job, status):
+        job.status = status
+        job.finished_at = time.time()
+        self._save(job)
+
+    def _prune(self):
+        """Oublie les tâches terminées depuis plus de `retention` secondes"""
+        limit = time.time() - self.retention
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.status in FINISHED_STATES and job.finished_at < limit
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+            for suffix in (".json", ".cancel"):
+                path = self._state_path(job_id, suffix)
+                if path is not None:
+                    path.unlink(missing_ok=True)
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+            # Admission attendue hors du verrou: la tâche en tête reste "queued"
+            # (annulable, position 1) tant qu'aucune place ne s'est libérée
+            with self.admit():
+                with self._cond:
+                    if not self._pending:
+                        # Annulée ou prise par un autre worker pendant l'attente
+                        continue
+                    job = self._pending.popleft()
+                    if self._cancel_marked(job):
+                        print(f"🛑 Tâche {job.id} annulée")
+                        self._finish(job, CANCELLED)
+                        continue
+                    job.status = RUNNING
+                    job.started_at = time.time()
+                    self._save(job)
+                    # Les positions des tâches restantes ont changé
+                    for position, pending in enumerate(self._pending, 1):
+                        self._save(pending, position)
+
+                self._run(job)
+
+    def _run(self, job):
+        try:
+            job.result = self.runner(*job.args, progress=lambda stage, percent: self._report(job, stage, percent))
+            job.progress = 100.0
+            self._finish(job, DONE)
+        except JobCancelled:
+            print(f"🛑 Tâche {job.id} annulée")
+            self._finish(job, CANCELLED)
+        except Exception as e:
+            print(f"❌ Tâche {job.id} en erreur: {e}")
+            job.error = str(e)
+            self._finish(job, FAILED)
@@ -0,0 +1,103 @@
+"""
+Choix de la langue avant la transcription
+Quelques fenêtres de 30 s passent par detect_language de Whisper et un vote
+décide de la langue, au lieu de transcrire le fichier entier deux fois
+"""
+
+import os
+import time
+
+import numpy as np
+
+from audio_loader import SAMPLE_RATE
+
+WINDOW_SECONDS = 30
+
+# En dessous de ce niveau RMS une fenêtre est considérée comme du silence
+SILENCE_RMS = 1e-3
+
+
+def _sample_windows(audio, count, window_seconds=WINDOW_SECONDS):
+    """Fenêtres réparties uniformément sur le fichier, en écartant le silence"""
+    window = window_seconds * SAMPLE_RATE
+    if len(audio) <= window:
+        return [np.asarray(audio)]
+
+    # On examine deux fois plus de positions que nécessaire pour pouvoir ignorer les silences
+    offsets = np.linspace(0, len(audio) - window, num=2 * count + 1).astype(int)
+    candidates = [np.asarray(audio[o:o + window]) for o in offsets]
+    voiced = [w for w in candidates if np.sqrt(np.mean(w ** 2)) >= SILENCE_RMS]
+    pool = voiced or candidates
+    picks = np.linspace(0, len(pool) - 1, num=min(count, len(pool))).round().astype(int)
+    return [pool[i] for i in picks]
+
+
+class LanguagePolicy:
+    """
+    Politique de langue configurable:
+      - force: langue imposée, aucune détection
+      - allowed: langues acceptées telles quelles (None = toutes)
+      - fallback: langue utilisée quand la langue détectée n'est pas autorisée
+    """
+
+    def __init__(self, force=None, allowed=("fr",), fallback="fr", windows=3):
+        self.force = force
+        self.allowed = tuple(allowed) if allowed else None
+        self.fallback = fallback
+        self.windows = windows
+
+    @classmethod
+    def from_env(cls):
+        allowed = os.environ.get("WHISPER_LANGUAGES", "fr")
+        return cls(
+            force=os.environ.get("WHISPER_LANGUAGE") or None,
+            allowed=[lang.strip() for lang in allowed.split(",") if lang.strip()],
+            fallback=os.environ.get("WHISPER_FALLBACK_LANGUAGE", "fr"),
+            windows=int(os.environ.get("LANGUAGE_DETECT_WINDOWS", 3)),
+        )
+
+    def settings(self):
+        """Paramètres qui influencent le résultat (clé de cache)"""
+        return {"force": self.force, "allowed": self.allowed, "fallback": self.fallback, "windows": self.windows}
+
+    def detect(self, whisper_model, audio):
+        """Vote pondéré par probabilité sur les fenêtres échantillonnées"""
+        import torch
+        import whisper
+
+        windows = _sample_windows(audio, self.windows)
+        mel = torch.stack([
+            whisper.log_mel_spectrogram(whisper.pad_or_trim(w), whisper_model.dims.n_mels)
+            for w in windows
+        ]).to(whisper_model.device)
+        _, probs = whisper_model.detect_language(mel)
+
+        votes = {}
+        for window_probs in probs:
+            for lang, p in window_probs.items():
+                votes[lang] = votes.get(lang, 0.0) + p / len(probs)
+        detected = max(votes, key=votes.get)
+        return detected, votes[detected], len(windows)
+
+    def decide(self, whisper_model, audio):
+        """Retourne la langue à utiliser et les détails de la décision"""
+        if self.force:
+            return {"language": self.force, "detected": None, "reason": "forced", "detect_seconds": 0.0}
+
+        t0 = time.perf_counter()
+        detected, probability, windows = self.detect(whisper_model, audio)
+        elapsed = time.perf_counter() - t0
+
+        if self.allowed is None or detected in self.allowed:
+            language, reason = detected, "detected"
+        else:
+            language, reason = self.fallback, "fallback"
+
+        return {
+            "language": language,
+            "detected": detected,
+            "probability": round(probability, 3),
+            "windows": windows,
+            "reason": reason,
+            "detect_seconds": round(elapsed, 3),
+        }
@@ -0,0 +1,222 @@
+"""
+Transcription en direct (micro)
+Le PCM 16 kHz arrive par petits blocs; Whisper retranscrit une fenêtre
+glissante bornée, les segments stables sont validés et le reste est renvoyé
+comme texte provisoire. Chaque segment validé reçoit un locuteur en comparant
+son empreinte vocale à celles des locuteurs déjà entendus
+"""
+
+import time
+
+import numpy as np
+
+from audio_loader import SAMPLE_RATE
+from language_policy import SILENCE_RMS
+from pipeline import analyze_speakers
+from result_model import TIME_DECIMALS, build_segments
+
+# Contexte transmis d'une passe à la suivante (initial_prompt de Whisper)
+PROMPT_CHARS = 200
+
+
+def pcm16_to_float(data):
+    """PCM 16 bits little-endian mono -> float32 dans [-1, 1]"""
+    return np.frombuffer(data, dtype="<i2").astype(np.float32) / 32768.0
+
+
+class SpeakerTracker:
+    """
+    Attribution incrémentale des locuteurs.
+
+    Chaque empreinte est comparée (cosinus, en une opération matricielle) au
+    centroïde de chaque locuteur déjà vu: au-delà de `threshold` le centroïde
+    du plus proche est mis à jour, sinon un nouveau locuteur est créé (dans la
+    limite de `max_speakers`).
+    """
+
+    def __init__(self, threshold=0.5, max_speakers=8):
+        self.threshold = threshold
+        self.max_speakers = max_speakers
+        # Somme des empreintes normalisées de chaque locuteur (une ligne par locuteur)
+        self._sums = None
+
+    @property
+    def num_speakers(self):
+        return 0 if self._sums is None else len(self._sums)
+
+    def label(self, index):
+        return f"SPEAKER_{index:02d}"
+
+    def assign(self, embedding):
+        """Indice du locuteur de `embedding`, ou None si l'empreinte est inexploitable"""
+        embedding = np.asarray(embedding, dtype=np.float64).ravel()
+        norm = np.linalg.norm(embedding)
+        if not np.isfinite(norm) or norm == 0:
+            return None
+        embedding = embedding / norm
+
+        if self._sums is None:
+            self._sums = embedding[None, :]
+            return 0
+        centroids = self._sums / np.linalg.norm(self._sums, axis=1, keepdims=True)
+        similarities = centroids @ embedding
+        best = int(np.argmax(similarities))
+        if similarities[best] >= self.threshold or self.num_speakers >= self.max_speakers:
+            self._sums[best] += embedding
+            return best
+        self._sums = np.vstack([self._sums, embedding])
+        return self.num_speakers - 1
+
+
+class LiveSession:
+    """
+    Session de transcription en direct.
+
+    `feed` ajoute du PCM; dès que `step_seconds` de nouveau son sont arrivés,
+    `process` retranscrit le tampon (au plus ~`window_seconds`). Les segments
+    qui se terminent plus de `hold_seconds` avant la fin du tampon, sauf le
+    dernier, sont validés et retirés du tampon; quand le tampon atteint
+    `window_seconds`, la validation est forcée, ce qui borne la latence.
+    """
+
+    def __init__(
+        self, whisper_model, language, embed=None, tracker=None,
+        window_seconds=15.0, step_seconds=1.0, hold_seconds=1.0, min_embed_seconds=1.0,
+    ):
+        self.whisper_model = whisper_model
+        self.language = language
+        self.embed = embed
+        self.tracker = tracker or SpeakerTracker()
+        self.window_seconds = window_seconds
+        self.step_seconds = step_seconds
+        self.hold_seconds = hold_seconds
+        self.min_embed_seconds = min_embed_seconds
+
+        self._buffer = np.zeros(0, dtype=np.float32)
+        # Position du début du tampon dans le flux (échantillons)
+        self._buffer_start = 0
+        self._received = 0
+        self._decoded_at = 0
+        self._prompt = None
+        self.segments = []
+        self.labels = []
+        self.decode_seconds = []
+
+    @property
+    def stream_seconds(self):
+        return self._received / SAMPLE_RATE
+
+    def feed(self, data):
+        samples = pcm16_to_float(data)
+        self._buffer = np.concatenate([self._buffer, samples])
+        self._received += len(samples)
+
+    def ready(self):
+        return self._received - self._decoded_at >= self.step_seconds * SAMPLE_RATE
+
+    def _speaker(self, start, end):
+        """Locuteur d'un segment validé (temps relatifs au tampon)"""
+        if self.embed is None:
+            return "ORATEUR_PRINCIPAL"
+        previous = self.labels[-1] if self.labels else None
+        if end - start < self.min_embed_seconds:
+            # Trop court pour une empreinte fiable: on garde le locuteur précédent
+            return previous or self.tracker.label(0)
+        index = self.tracker.assign(self.embed(self._buffer[int(start * SAMPLE_RATE):int(end * SAMPLE_RATE)]))
+        if index is None:
+            return previous or self.tracker.label(0)
+        return self.tracker.label(index)
+
+    def _commit(self, segments):
+        events = []
+        offset = self._buffer_start / SAMPLE_RATE
+        for seg in segments:
+            speaker = self._speaker(seg["start"], seg["end"])
+            segment = {"start": seg["start"] + offset, "end": seg["end"] + offset, "text": seg["text"]}
+            self.segments.append(segment)
+            self.labels.append(speaker)
+            events.append({
+                "type": "segment",
+                "id": len(self.segments) - 1,
+                "start": round(segment["start"], TIME_DECIMALS),
+                "end": round(segment["end"], TIME_DECIMALS),
+                "text": segment["text"].strip(),
+                "speaker": speaker,
+                "overlap": False,
+            })
+        self._prompt = "".join(seg["text"] for seg in self.segments[-10:])[-PROMPT_CHARS:] or None
+        return events
+
+    def _drop(self, seconds):
+        samples = min(int(seconds * SAMPLE_RATE), len(self._buffer))
+        self._buffer = self._buffer[samples:]
+        self._buffer_start += samples
+
+    def process(self, final=False):
+        """Retranscrit le tampon; retourne les évènements segment (validés) et partial"""
+        self._decoded_at = self._received
+        buffer_seconds = len(self._buffer) / SAMPLE_RATE
+        if not len(self._buffer):
+            return []
+        if np.sqrt(np.mean(self._buffer ** 2)) < SILENCE_RMS:
+            # Silence: rien à transcrire, on garde seulement la dernière demi-seconde
+            self._drop(max(0.0, buffer_seconds - 0.5))
+            return []
+
+        t0 = time.perf_counter()
+        result = self.whisper_model.transcribe(
+            self._buffer, language=self.language, initial_prompt=self._prompt,
+            condition_on_previous_text=False,
+        )
+        decode_seconds = time.perf_counter() - t0
+        self.decode_seconds.append(decode_seconds)
+        segments = [seg for seg in result["segments"] if seg["text"].strip()]
+
+        if final:
+            stable = len(segments)
+        else:
+            stable = 0
+            for i, seg in enumerate(segments[:-1]):
+                if seg["end"] <= buffer_seconds - self.hold_seconds:
+                    stable = i + 1
+            if not stable and buffer_seconds >= self.window_seconds:
+                # Tampon plein: on valide tout sauf le dernier segment, ou tout s'il est seul
+                stable = max(len(segments) - 1, 1) if segments else 0
+        events = self._commit(segments[:stable])
+
+        if final:
+            self._drop(buffer_seconds)
+        elif stable:
+            self._drop(segments[stable - 1]["end"])
+        elif not segments and buffer_seconds >= self.window_seconds:
+            self._drop(buffer_seconds - self.hold_seconds)
+
+        pending = segments[stable:]
+        if pending:
+            offset = self._buffer_start / SAMPLE_RATE
+            events.append({
+                "type": "partial",
+                "start": round(offset, TIME_DECIMALS),
+                "end": round(offset + pending[-1]["end"], TIME_DECIMALS),
+                "text": "".join(seg["text"] for seg in pending).strip(),
+                "decode_seconds": round(decode_seconds, 3),
+            })
+        elif not final:
+            events.append({"type": "partial", "text": "", "decode_seconds": round(decode_seconds, 3)})
+        return events
+
+    def finish(self):
+        """Valide le reste du tampon; retourne les derniers évènements puis done"""
+        events = self.process(final=True)
+        segments, speakers = build_segments(self.segments, self.labels, [False] * len(self.segments))
+        result = analyze_speakers(segments, speakers)
+        result["language"] = {"language": self.language, "reason": "live"}
+        result["timings"] = {
+            "mode": "live",
+            "audio_seconds": round(self.stream_seconds, 3),
+            "decode_passes": len(self.decode_seconds),
+            "decode_mean": round(float(np.mean(self.decode_seconds)), 3) if self.decode_seconds else 0.0,
+            "decode_max": round(max(self.decode_seconds, default=0.0), 3),
+        }
+        events.append({"type": "done", "result": result})
+        return events
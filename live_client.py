@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Micro simulé pour le mode direct
+Décode un fichier audio (WAV ou tout format lu par ffmpeg) en 16 kHz et
+l'envoie au rythme réel sur le WebSocket /live, comme le ferait le
+navigateur; affiche le texte provisoire, les segments validés et la latence
+entre la fin d'un segment dans l'audio et sa réception
+"""
+
+import argparse
+import json
+import statistics
+import threading
+import time
+
+import numpy as np
+import simple_websocket
+
+from audio_loader import SAMPLE_RATE, load_audio
+
+
+def to_pcm16(audio):
+    return (np.clip(audio, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+
+
+def receive_events(ws, started, speed, latencies, done):
+    """Affiche les évènements du serveur; la latence est mesurée par rapport à l'envoi de l'audio"""
+    try:
+        while True:
+            event = json.loads(ws.receive())
+            if event["type"] == "ready":
+                print(f"🎙️ Session ouverte ({event['model']}, {event['language']})")
+            elif event["type"] == "partial":
+                print(f"\r\033[K… {event['text'][-100:]}", end="", flush=True)
+            elif event["type"] == "segment":
+                # Instant où la fin du segment a été envoyée
+                latency = time.perf_counter() - (started[0] + event["end"] / speed)
+                latencies.append(latency)
+                print(
+                    f"\r\033[K[{event['start']:7.1f} - {event['end']:7.1f}] {event['speaker']}: {event['text']}"
+                    f"  (+{latency:.1f} s)"
+                )
+            elif event["type"] == "done":
+                timings = event["result"]["timings"]
+                print(
+                    f"\r\033[K✅ {len(event['result']['segments']['start'])} segments, "
+                    f"{len(event['result']['speakers'])} locuteur(s), {timings['decode_passes']} passes Whisper "
+                    f"(moyenne {timings['decode_mean']:.2f} s, max {timings['decode_max']:.2f} s)"
+                )
+                break
+            elif event["type"] == "error":
+                print(f"\r\033[K❌ {event['error']}")
+                break
+    except simple_websocket.ConnectionClosed:
+        print("\n🔌 Connexion fermée par le serveur")
+    finally:
+        done.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("audio", help="Fichier audio joué comme un micro")
+    parser.add_argument("--url", default="ws://localhost:5002/live")
+    parser.add_argument("--model", help="Taille Whisper (défaut: LIVE_WHISPER_MODEL du serveur)")
+    parser.add_argument("--language", help="Langue (défaut: celle du serveur)")
+    parser.add_argument("--chunk-ms", type=int, default=100, help="Durée de chaque envoi (ms)")
+    parser.add_argument("--speed", type=float, default=1.0, help="Vitesse de lecture (2 = deux fois le temps réel)")
+    args = parser.parse_args()
+
+    audio = load_audio(args.audio)
+    params = "&".join(f"{name}={value}" for name, value in (("model", args.model), ("language", args.language)) if value)
+    ws = simple_websocket.Client.connect(args.url + (f"?{params}" if params else ""))
+
+    started = [time.perf_counter()]
+    latencies = []
+    done = threading.Event()
+    receiver = threading.Thread(target=receive_events, args=(ws, started, args.speed, latencies, done), daemon=True)
+    receiver.start()
+
+    chunk = int(SAMPLE_RATE * args.chunk_ms / 1000)
+    try:
+        started[0] = time.perf_counter()
+        for i, offset in enumerate(range(0, len(audio), chunk)):
+            if done.is_set():
+                break
+            ws.send(to_pcm16(audio[offset:offset + chunk]))
+            # Rythme réel: le bloc suivant part quand l'audio envoyé aurait été joué
+            delay = started[0] + (i + 1) * args.chunk_ms / 1000 / args.speed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        ws.send(json.dumps({"type": "stop"}))
+        done.wait()
+    except KeyboardInterrupt:
+        print("\n🛑 Interrompu")
+    finally:
+        if ws.connected:
+            ws.close()
+
+    if latencies:
+        print(
+            f"⏱️ Latence des segments validés: médiane {statistics.median(latencies):.1f} s, "
+            f"max {max(latencies):.1f} s"
+        )
+
+
+if __name__ == "__main__":
+    main()
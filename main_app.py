@@ -1,40 +1,37 @@
-from flask import Flask, request, jsonify, render_template_string
-import whisper
+from flask import Flask, Response, request, jsonify, render_template_string
+from werkzeug.exceptions import RequestEntityTooLarge
 import os
-from pathlib import Path
-from pyannote.audio import Pipeline
-from datetime import timedelta
 import json
+import logging
+from contextlib import closing, nullcontext
+from functools import partial
+from pathlib import Path
 
-app = Flask(__name__)
-app.config['UPLOAD_FOLDER'] = 'uploads'
-Path(app.config['UPLOAD_FOLDER']).mkdir(exist_ok=True)
+from pipeline import RESULT_FORMAT_VERSION, run_pipeline
+from jobs import JobCancelled, JobQueue, QueueFull
+from language_policy import LanguagePolicy
+from result_cache import ResultCache, make_key
+from chunked_transcribe import ChunkedTranscriber
+from streaming import stream_cached, stream_pipeline, to_ndjson
+from model_registry import WHISPER_SIZES, ModelRegistry
+from upload_ingest import UploadRequest, UploadStore
+from metrics import Metrics, profiled
+from result_model import page, transcript
+from live import LiveSession, SpeakerTracker
+from voiceprints import VoiceprintIndex, speaker_embedder
+from audio_loader import SAMPLE_RATE
+from serving import InferenceSlots, SlotsFull, available_cpus
 
-# Load models once at startup
-print("🔄 Chargement des modèles...")
-whisper_model = whisper.load_model("large-v3")
+try:
+    from flask_sock import Sock
+except ImportError:
+    Sock = None
 
-# Load diarization pipeline with error handling
 try:
     from dotenv import load_dotenv
     load_dotenv()
-    hf_token = os.environ.get("HF_AUTH_TOKEN")
-    print(f"🔑 Token HF: {hf_token[:10]}..." if hf_token else "❌ Pas de token HF")
-    
-    if not hf_token:
-        raise ValueError("HF_AUTH_TOKEN not found in environment")
-    
-    print("🔄 Chargement du pipeline de diarisation...")
-    diarization_pipeline = Pipeline.from_pretrained(
-        "pyannote/speaker-diarization", 
-        use_auth_token=hf_token
-    )
-    print("✅ Modèles chargés avec diarisation!")
-except Exception as e:
-    print(f"⚠️ Diarisation non disponible: {e}")
-    print("Utilisation du mode alternatif (attribution automatique)")
-    diarization_pipeline = None
-    print("✅ Modèle Whisper chargé (sans diarisation)!")
+except ImportError:
+    pass
 
 HTML_TEMPLATE = '''
 <!DOCTYPE html>
@@ -78,9 +75,9 @@ HTML_TEMPLATE = '''
         .speaker-card.speaker-0 { background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); }
         .speaker-card.speaker-1 { background: linear-gradient(135deg, #f093fb 0%, #f5576c 100%); }
         .speaker-card.speaker-2 { background: linear-gradient(135deg, #4facfe 0%, #00f2fe 100%); }
-        .speaker-segments { max-height: 200px; overflow-y: auto; margin-top: 10px; }
-        .segment { background: rgba(255,255,255,0.2); padding: 10px; margin: 5px 0; border-radius: 5px; }
-        .timestamp { font-size: 0.9em; opacity: 0.8; }
+        .chat-partial { font-style: italic; opacity: 0.6; padding: 0 60px; min-height: 1.2em; }
+        .name-btn { margin-top: 10px; background: rgba(255,255,255,0.25); color: white; border: 1px solid white; padding: 5px 12px; border-radius: 15px; cursor: pointer; }
+        .transcript-link { display: inline-block; margin-bottom: 20px; color: #667eea; font-weight: bold; }
         .status { padding: 15px; border-radius: 10px; margin: 20px 0; text-align: center; font-weight: bold; }
         .success { background: #d4edda; color: #155724; }
         .error { background: #f8d7da; color: #721c24; }
@@ -99,12 +96,30 @@ HTML_TEMPLATE = '''
                 <input type="file" id="audioFile" accept="audio/*" style="display: none;" onchange="handleFileSelect(this)">
                 <h3>📁 Glissez votre fichier audio ici</h3>
                 <p>ou cliquez pour sélectionner</p>
-                <p><small>Formats: .m4a, .wav, .mp3, .mp4 | Max: 500MB</small></p>
+                <p><small>Formats: .m4a, .wav, .mp3, .mp4 | Max: {{ max_upload_mb }}MB</small></p>
             </div>
             <div id="fileName" style="margin-top: 15px; font-weight: bold; color: #667eea;"></div>
+            <div style="margin-top: 15px;">
+                <label><input type="checkbox" id="liveMode" checked> ⚡ Affichage en direct des segments</label>
+                <label style="margin-left: 20px;">🧠 Modèle
+                    <select id="modelSize">
+                        {% for size in model_sizes %}
+                        <option value="{{ size }}" {% if size == default_model %}selected{% endif %}>{{ size }}</option>
+                        {% endfor %}
+                    </select>
+                </label>
+            </div>
             <button class="upload-btn" id="uploadBtn" onclick="startTranscription()" disabled>
                 🚀 Démarrer l'analyse
             </button>
+            <button class="upload-btn" id="cancelBtn" onclick="cancelJob()" style="display: none;">
+                🛑 Annuler
+            </button>
+            {% if live_enabled %}
+            <button class="upload-btn" id="liveBtn" onclick="toggleLive()">
+                🎙️ Micro en direct
+            </button>
+            {% endif %}
             <div class="progress" id="progress">
                 <div class="progress-bar" id="progressBar"></div>
             </div>
@@ -114,6 +129,7 @@ HTML_TEMPLATE = '''
         <div class="results" id="results">
             <h2>💬 Conversation</h2>
             <div class="chat-container" id="chatContainer"></div>
+            <a class="transcript-link" id="transcriptLink" target="_blank" style="display: none;">📄 Transcript complet (texte)</a>
             
             <h2>👥 Analyse par Locuteur</h2>
             <div class="speakers-section" id="speakersSection"></div>
@@ -122,6 +138,8 @@ HTML_TEMPLATE = '''
 
     <script>
         let selectedFile = null;
+        let currentJobId = null;
+        const MAX_UPLOAD_MB = {{ max_upload_mb }};
 
         // Drag & Drop
         const fileDrop = document.getElementById('fileDrop');
@@ -145,7 +163,14 @@ HTML_TEMPLATE = '''
         function handleFileSelect(input) {
             selectedFile = input.files[0];
             if (selectedFile) {
-                document.getElementById('fileName').textContent = `📎 ${selectedFile.name} (${(selectedFile.size/1024/1024).toFixed(1)} MB)`;
+                const sizeMb = selectedFile.size / 1024 / 1024;
+                if (sizeMb > MAX_UPLOAD_MB) {
+                    document.getElementById('fileName').textContent = `❌ ${selectedFile.name} (${sizeMb.toFixed(1)} MB) dépasse la limite de ${MAX_UPLOAD_MB} MB`;
+                    document.getElementById('uploadBtn').disabled = true;
+                    selectedFile = null;
+                    return;
+                }
+                document.getElementById('fileName').textContent = `📎 ${selectedFile.name} (${sizeMb.toFixed(1)} MB)`;
                 document.getElementById('uploadBtn').disabled = false;
             }
         }
@@ -155,259 +180,1096 @@ HTML_TEMPLATE = '''
 
             const formData = new FormData();
             formData.append('audio', selectedFile);
+            formData.append('model', document.getElementById('modelSize').value);
 
             document.getElementById('uploadBtn').disabled = true;
             document.getElementById('uploadBtn').textContent = '⏳ Analyse en cours...';
             document.getElementById('progress').style.display = 'block';
             document.getElementById('results').style.display = 'none';
 
-            // Simulate progress
-            let progress = 0;
-            const progressInterval = setInterval(() => {
-                progress += Math.random() * 5;
-                if (progress > 95) progress = 95;
-                document.getElementById('progressBar').style.width = progress + '%';
-            }, 1000);
+            if (document.getElementById('liveMode').checked) {
+                document.getElementById('progress').style.display = 'none';
+                startStreaming(formData)
+                .then(() => {
+                    document.getElementById('status').innerHTML = '<div class="status success">✅ Analyse terminée avec succès!</div>';
+                })
+                .catch(error => {
+                    document.getElementById('status').innerHTML = `<div class="status error">❌ Erreur: ${error.message}</div>`;
+                })
+                .finally(() => {
+                    document.getElementById('uploadBtn').disabled = false;
+                    document.getElementById('uploadBtn').textContent = '🚀 Démarrer l\\'analyse';
+                });
+                return;
+            }
 
-            fetch('/process', {
+            // Soumission de la tâche puis suivi de la progression réelle
+            fetch('/jobs', {
                 method: 'POST',
                 body: formData
             })
             .then(response => response.json())
-            .then(data => {
-                clearInterval(progressInterval);
+            .then(job => {
+                if (!job.success) throw new Error(job.error);
+                // Résultat déjà en cache: pas de suivi nécessaire
+                if (job.status === 'done') return job;
+                currentJobId = job.job_id;
+                document.getElementById('cancelBtn').style.display = 'inline-block';
+                return pollJob(job.job_id);
+            })
+            .then(job => {
                 document.getElementById('progressBar').style.width = '100%';
                 
-                if (data.success) {
-                    displayResults(data);
+                if (job.status === 'done') {
+                    displayResults(job.result);
                     document.getElementById('status').innerHTML = '<div class="status success">✅ Analyse terminée avec succès!</div>';
+                } else if (job.status === 'cancelled') {
+                    document.getElementById('status').innerHTML = '<div class="status info">🛑 Analyse annulée</div>';
                 } else {
-                    document.getElementById('status').innerHTML = `<div class="status error">❌ ${data.error}</div>`;
+                    document.getElementById('status').innerHTML = `<div class="status error">❌ ${job.error}</div>`;
                 }
             })
             .catch(error => {
-                clearInterval(progressInterval);
                 document.getElementById('status').innerHTML = `<div class="status error">❌ Erreur: ${error.message}</div>`;
             })
             .finally(() => {
+                currentJobId = null;
+                document.getElementById('cancelBtn').style.display = 'none';
                 document.getElementById('uploadBtn').disabled = false;
                 document.getElementById('uploadBtn').textContent = '🚀 Démarrer l\\'analyse';
                 setTimeout(() => document.getElementById('progress').style.display = 'none', 1000);
             });
         }
 
-        function displayResults(data) {
-            // Chat-style conversation
+        const STAGE_LABELS = {
+            decode: '🎧 Décodage audio',
+            transcribe: '📝 Transcription',
+            diarize: '👥 Identification des locuteurs',
+            merge: '🔗 Fusion des données'
+        };
+
+        function pollJob(jobId) {
+            return new Promise((resolve, reject) => {
+                const timer = setInterval(() => {
+                    fetch(`/jobs/${jobId}`)
+                    .then(response => response.json())
+                    .then(job => {
+                        if (!job.success) throw new Error(job.error);
+                        document.getElementById('progressBar').style.width = job.progress + '%';
+                        
+                        if (job.status === 'queued') {
+                            document.getElementById('status').innerHTML = `<div class="status info">⏳ En file d'attente (position ${job.position})</div>`;
+                        } else if (job.status === 'running') {
+                            const label = STAGE_LABELS[job.stage] || '⏳ Démarrage';
+                            document.getElementById('status').innerHTML = `<div class="status info">${label}... ${Math.round(job.progress)}%</div>`;
+                        } else {
+                            clearInterval(timer);
+                            resolve(job);
+                        }
+                    })
+                    .catch(error => {
+                        clearInterval(timer);
+                        reject(error);
+                    });
+                }, 1000);
+            });
+        }
+
+        function cancelJob() {
+            if (!currentJobId) return;
+            fetch(`/jobs/${currentJobId}`, { method: 'DELETE' });
+        }
+
+        // Secondes -> H:MM:SS
+        function createElement(tag, className, text) {
+            const element = document.createElement(tag);
+            if (className) element.className = className;
+            element.textContent = text;
+            return element;
+        }
+
+        function formatTime(seconds) {
+            const total = Math.floor(seconds);
+            const minutes = String(Math.floor(total / 60) % 60).padStart(2, '0');
+            return `${Math.floor(total / 3600)}:${minutes}:${String(total % 60).padStart(2, '0')}`;
+        }
+
+        function createChatMessage(segment, speakerIndex, isMonoSpeaker) {
+            const messageDiv = document.createElement('div');
+            
+            if (isMonoSpeaker) {
+                // Mode mono-locuteur: tous les messages à gauche
+                messageDiv.className = `chat-message speaker-0`;
+            } else {
+                // Mode multi-locuteurs: alternance gauche/droite
+                messageDiv.className = `chat-message speaker-${speakerIndex}`;
+            }
+            
+            // Locuteur encore inconnu (diarisation en cours en mode direct)
+            const speaker = segment.speaker || '…';
+            
+            const avatarDiv = document.createElement('div');
+            avatarDiv.className = `chat-avatar speaker-${speakerIndex}`;
+            avatarDiv.textContent = isMonoSpeaker ? '🎤' : speaker.charAt(speaker.length - 1);
+            
+            const bubbleDiv = document.createElement('div');
+            bubbleDiv.className = `chat-bubble speaker-${speakerIndex}`;
+            
+            const speakerDisplayName = isMonoSpeaker ? 'Orateur' : speaker;
+            
+            // Noms (donnés par les utilisateurs) et texte insérés comme texte, jamais comme HTML
+            bubbleDiv.append(
+                createElement('div', 'speaker-name', speakerDisplayName),
+                createElement('div', '', segment.text),
+                createElement('div', 'chat-timestamp', formatTime(segment.start)),
+            );
+            
+            // Pour mono-locuteur, toujours avatar à gauche
+            if (isMonoSpeaker || speakerIndex % 2 === 0) {
+                messageDiv.appendChild(avatarDiv);
+                messageDiv.appendChild(bubbleDiv);
+            } else {
+                messageDiv.appendChild(bubbleDiv);
+                messageDiv.appendChild(avatarDiv);
+            }
+            
+            return messageDiv;
+        }
+
+        // Mode direct: segments affichés au fil de l'eau (NDJSON)
+        function startStreaming(formData) {
             const chatContainer = document.getElementById('chatContainer');
             chatContainer.innerHTML = '';
+            document.getElementById('speakersSection').innerHTML = '';
+            document.getElementById('results').style.display = 'block';
             
-            // Get speaker names and assign colors
-            const speakerNames = Object.keys(data.speakers);
+            const segments = [];
+            const nodes = [];
             const speakerColors = {};
-            speakerNames.forEach((speaker, index) => {
-                speakerColors[speaker] = index;
-            });
+            let isMonoSpeaker = false;
             
-            // Check if mono-speaker
-            const isMonoSpeaker = speakerNames.length === 1 || speakerNames.some(name => name.includes('ORATEUR_PRINCIPAL'));
+            const speakerIndexOf = (speaker) => {
+                if (!speaker) return 0;
+                if (!(speaker in speakerColors)) speakerColors[speaker] = Object.keys(speakerColors).length;
+                return speakerColors[speaker];
+            };
             
-            // Display messages in chat format
-            data.segments.forEach(segment => {
-                const messageDiv = document.createElement('div');
-                const speakerIndex = speakerColors[segment.speaker] || 0;
-                
-                if (isMonoSpeaker) {
-                    // Mode mono-locuteur: tous les messages à gauche
-                    messageDiv.className = `chat-message speaker-0`;
+            const renderSegment = (segment) => {
+                const node = createChatMessage(segment, speakerIndexOf(segment.speaker), isMonoSpeaker);
+                if (nodes[segment.id]) {
+                    chatContainer.replaceChild(node, nodes[segment.id]);
                 } else {
-                    // Mode multi-locuteurs: alternance gauche/droite
-                    messageDiv.className = `chat-message speaker-${speakerIndex}`;
+                    chatContainer.appendChild(node);
                 }
-                
-                const avatarDiv = document.createElement('div');
-                avatarDiv.className = `chat-avatar speaker-${speakerIndex}`;
-                avatarDiv.textContent = isMonoSpeaker ? '🎤' : segment.speaker.charAt(segment.speaker.length - 1);
-                
-                const bubbleDiv = document.createElement('div');
-                bubbleDiv.className = `chat-bubble speaker-${speakerIndex}`;
-                
-                const speakerDisplayName = isMonoSpeaker ? 'Orateur' : segment.speaker;
-                
-                bubbleDiv.innerHTML = `
-                    <div class="speaker-name">${speakerDisplayName}</div>
-                    <div>${segment.text}</div>
-                    <div class="chat-timestamp">${segment.start}</div>
-                `;
-                
-                // Pour mono-locuteur, toujours avatar à gauche
-                if (isMonoSpeaker || speakerIndex % 2 === 0) {
-                    messageDiv.appendChild(avatarDiv);
-                    messageDiv.appendChild(bubbleDiv);
-                } else {
-                    messageDiv.appendChild(bubbleDiv);
-                    messageDiv.appendChild(avatarDiv);
+                nodes[segment.id] = node;
+            };
+            
+            const handleEvent = (event) => {
+                if (event.type === 'meta') {
+                    document.getElementById('status').innerHTML = `<div class="status info">🎧 Audio de ${Math.round(event.duration)} s, transcription en direct...</div>`;
+                } else if (event.type === 'segment') {
+                    segments[event.id] = event;
+                    renderSegment(event);
+                    chatContainer.scrollTop = chatContainer.scrollHeight;
+                } else if (event.type === 'speakers') {
+                    isMonoSpeaker = event.num_speakers === 1;
+                    event.updates.forEach(update => {
+                        Object.assign(segments[update.id], update);
+                        renderSegment(segments[update.id]);
+                    });
+                } else if (event.type === 'done') {
+                    displayResults(event.result);
+                } else if (event.type === 'error') {
+                    throw new Error(event.error);
                 }
+            };
+            
+            return fetch('/process/stream', { method: 'POST', body: formData })
+            .then(response => {
+                // Refus (serveur occupé, paramètres invalides): réponse JSON et non un flux
+                if (!response.ok) return response.json().then(data => { throw new Error(data.error); });
+                const reader = response.body.getReader();
+                const decoder = new TextDecoder();
+                let buffer = '';
                 
-                chatContainer.appendChild(messageDiv);
+                const read = () => reader.read().then(({ done, value }) => {
+                    buffer += decoder.decode(value || new Uint8Array(), { stream: !done });
+                    const lines = buffer.split('\\n');
+                    buffer = lines.pop();
+                    lines.filter(line => line.trim()).forEach(line => handleEvent(JSON.parse(line)));
+                    if (!done) return read();
+                    if (buffer.trim()) handleEvent(JSON.parse(buffer));
+                });
+                return read();
+            });
+        }
+
+        // Micro en direct: PCM 16 bits 16 kHz envoyé sur le WebSocket /live,
+        // texte provisoire puis segments validés avec leur locuteur
+        let liveSocket = null;
+        let liveAudio = null;
+
+        function downsampleToPcm16(samples, sampleRate) {
+            const ratio = sampleRate / 16000;
+            const pcm = new Int16Array(Math.floor(samples.length / ratio));
+            for (let i = 0; i < pcm.length; i++) {
+                // Moyenne des échantillons couverts (filtre anti-repliement grossier)
+                const first = Math.floor(i * ratio);
+                const last = Math.min(samples.length, Math.floor((i + 1) * ratio));
+                let sum = 0;
+                for (let j = first; j < last; j++) sum += samples[j];
+                const value = sum / Math.max(1, last - first);
+                pcm[i] = Math.max(-1, Math.min(1, value)) * 32767;
+            }
+            return pcm.buffer;
+        }
+
+        function stopLiveAudio() {
+            if (!liveAudio) return;
+            liveAudio.processor.disconnect();
+            liveAudio.source.disconnect();
+            liveAudio.stream.getTracks().forEach(track => track.stop());
+            liveAudio.context.close();
+            liveAudio = null;
+        }
+
+        async function toggleLive() {
+            const liveBtn = document.getElementById('liveBtn');
+            const status = document.getElementById('status');
+            if (liveSocket) {
+                // Le serveur valide le reste du tampon puis envoie le résultat complet
+                stopLiveAudio();
+                liveSocket.send(JSON.stringify({ type: 'stop' }));
+                liveBtn.disabled = true;
+                status.innerHTML = '<div class="status info">⏳ Finalisation de la transcription...</div>';
+                return;
+            }
+            
+            let stream;
+            try {
+                stream = await navigator.mediaDevices.getUserMedia({ audio: true });
+            } catch (error) {
+                status.innerHTML = `<div class="status error">❌ Micro indisponible: ${error.message}</div>`;
+                return;
+            }
+            
+            const chatContainer = document.getElementById('chatContainer');
+            if (transcriptObserver) transcriptObserver.disconnect();
+            chatContainer.innerHTML = '';
+            document.getElementById('speakersSection').innerHTML = '';
+            document.getElementById('transcriptLink').style.display = 'none';
+            document.getElementById('results').style.display = 'block';
+            const partial = document.createElement('div');
+            partial.className = 'chat-partial';
+            chatContainer.appendChild(partial);
+            
+            const speakerColors = {};
+            const speakerIndexOf = (speaker) => {
+                if (!(speaker in speakerColors)) speakerColors[speaker] = Object.keys(speakerColors).length;
+                return speakerColors[speaker];
+            };
+            
+            const protocol = location.protocol === 'https:' ? 'wss' : 'ws';
+            const socket = new WebSocket(`${protocol}://${location.host}/live`);
+            liveSocket = socket;
+            let ready = false;
+            
+            const context = new AudioContext();
+            const source = context.createMediaStreamSource(stream);
+            const processor = context.createScriptProcessor(4096, 1, 1);
+            processor.onaudioprocess = (e) => {
+                if (ready && socket.readyState === WebSocket.OPEN) {
+                    socket.send(downsampleToPcm16(e.inputBuffer.getChannelData(0), context.sampleRate));
+                }
+            };
+            source.connect(processor);
+            processor.connect(context.destination);
+            liveAudio = { stream, context, source, processor };
+            
+            socket.onmessage = (message) => {
+                const event = JSON.parse(message.data);
+                if (event.type === 'ready') {
+                    ready = true;
+                    liveBtn.innerHTML = '⏹️ Arrêter le micro';
+                    status.innerHTML = `<div class="status info">🎙️ En direct (${event.model}, ${event.language}), parlez...</div>`;
+                } else if (event.type === 'partial') {
+                    partial.textContent = event.text;
+                    chatContainer.scrollTop = chatContainer.scrollHeight;
+                } else if (event.type === 'segment') {
+                    chatContainer.insertBefore(createChatMessage(event, speakerIndexOf(event.speaker), false), partial);
+                    chatContainer.scrollTop = chatContainer.scrollHeight;
+                } else if (event.type === 'done') {
+                    status.innerHTML = '<div class="status success">✅ Session en direct terminée</div>';
+                    displayResults(event.result);
+                } else if (event.type === 'error') {
+                    status.innerHTML = `<div class="status error">❌ Erreur: ${event.error}</div>`;
+                }
+            };
+            socket.onclose = () => {
+                stopLiveAudio();
+                liveSocket = null;
+                liveBtn.disabled = false;
+                liveBtn.innerHTML = '🎙️ Micro en direct';
+            };
+        }
+
+        // Vue virtualisée: les segments sont rendus par blocs, seulement autour de la
+        // zone visible; les blocs sortis de la vue sont vidés en gardant leur hauteur
+        // et les blocs absents du résultat sont chargés page par page
+        const BLOCK_SIZE = 100;
+        const ESTIMATED_MESSAGE_PX = 95;
+        let transcriptObserver = null;
+
+        function renderTranscript(data, labels, isMonoSpeaker) {
+            const chatContainer = document.getElementById('chatContainer');
+            if (transcriptObserver) transcriptObserver.disconnect();
+            chatContainer.innerHTML = '';
+            chatContainer.scrollTop = 0;
+            
+            const total = data.segments_total ?? data.segments.start.length;
+            const columns = { start: [], end: [], text: [], speaker: [], overlap: [] };
+            const blockCount = Math.ceil(total / BLOCK_SIZE);
+            const loading = [];
+            
+            const store = (offset, segments) => {
+                Object.keys(columns).forEach(name => {
+                    segments[name].forEach((value, i) => { columns[name][offset + i] = value; });
+                });
+            };
+            store(data.segments_offset || 0, data.segments);
+            
+            const loadBlock = (b) => {
+                const first = b * BLOCK_SIZE;
+                if (columns.start[Math.min(first + BLOCK_SIZE, total) - 1] !== undefined) return Promise.resolve();
+                if (!loading[b]) {
+                    loading[b] = fetch(`/results/${data.result_id}/segments?offset=${first}&limit=${BLOCK_SIZE}`)
+                    .then(response => response.json())
+                    .then(page => {
+                        if (!page.success) throw new Error(page.error);
+                        store(page.segments_offset, page.segments);
+                    })
+                    .catch(error => {
+                        loading[b] = null;
+                        document.getElementById('status').innerHTML = `<div class="status error">❌ Erreur: ${error.message}</div>`;
+                    });
+                }
+                return loading[b];
+            };
+            
+            const renderBlock = (block, b) => {
+                loadBlock(b).then(() => {
+                    if (!block.visible || block.childElementCount) return;
+                    const fragment = document.createDocumentFragment();
+                    for (let i = b * BLOCK_SIZE; i < Math.min(total, (b + 1) * BLOCK_SIZE); i++) {
+                        if (columns.start[i] === undefined) return;
+                        const segment = { start: columns.start[i], text: columns.text[i], speaker: labels[columns.speaker[i]] };
+                        fragment.appendChild(createChatMessage(segment, columns.speaker[i], isMonoSpeaker));
+                    }
+                    block.replaceChildren(fragment);
+                    block.style.height = '';
+                });
+            };
+            
+            transcriptObserver = new IntersectionObserver(entries => {
+                entries.forEach(entry => {
+                    const block = entry.target;
+                    block.visible = entry.isIntersecting;
+                    if (entry.isIntersecting) {
+                        renderBlock(block, Number(block.dataset.block));
+                    } else if (block.childElementCount) {
+                        block.style.height = block.offsetHeight + 'px';
+                        block.replaceChildren();
+                    }
+                });
+            }, { root: chatContainer, rootMargin: '600px 0px' });
+            
+            for (let b = 0; b < blockCount; b++) {
+                const block = document.createElement('div');
+                block.className = 'chat-block';
+                block.dataset.block = b;
+                block.style.height = Math.min(BLOCK_SIZE, total - b * BLOCK_SIZE) * ESTIMATED_MESSAGE_PX + 'px';
+                chatContainer.appendChild(block);
+                transcriptObserver.observe(block);
+            }
+        }
+
+        function nameSpeaker(data, index) {
+            const speaker = data.speakers[index];
+            const name = prompt(`Nom de ${speaker.label} :`, speaker.diarization_label ? speaker.label : '');
+            if (name === null) return;
+            
+            fetch(`/voiceprints/${speaker.voiceprint}`, {
+                method: 'PUT',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ name: name })
+            })
+            .then(response => response.json())
+            .then(response => {
+                if (!response.success) throw new Error(response.error);
+                const original = speaker.diarization_label || speaker.label;
+                data.speakers[index] = response.name
+                    ? { ...speaker, label: response.name, diarization_label: original }
+                    : { ...speaker, label: original, diarization_label: undefined };
+                displayResults(data);
+            })
+            .catch(error => {
+                document.getElementById('status').innerHTML = `<div class="status error">❌ Erreur: ${error.message}</div>`;
             });
+        }
+
+        function displayResults(data) {
+            const labels = data.speakers.map(speaker => speaker.label);
+            
+            // Check if mono-speaker
+            const isMonoSpeaker = labels.length === 1 || labels.includes('ORATEUR_PRINCIPAL');
+            
+            // Chat-style conversation (virtualisée)
+            renderTranscript(data, labels, isMonoSpeaker);
+            
+            const transcriptLink = document.getElementById('transcriptLink');
+            if (data.result_id) {
+                transcriptLink.href = `/results/${data.result_id}/transcript`;
+                transcriptLink.style.display = 'inline-block';
+            } else {
+                transcriptLink.style.display = 'none';
+            }
             
             // Speakers analysis
             const speakersSection = document.getElementById('speakersSection');
             speakersSection.innerHTML = '';
+            const totalDuration = data.speakers.reduce((sum, speaker) => sum + speaker.total_duration, 0) || 1;
             
-            Object.entries(data.speakers).forEach(([speaker, info], index) => {
+            data.speakers.forEach((speaker, index) => {
                 const speakerCard = document.createElement('div');
                 speakerCard.className = `speaker-card speaker-${index}`;
                 
-                speakerCard.innerHTML = `
-                    <h3>🎭 ${speaker}</h3>
-                    <p><strong>Temps de parole:</strong> ${info.duration}</p>
-                    <p><strong>Segments:</strong> ${info.segments.length}</p>
-                    <div class="speaker-segments">
-                        ${info.segments.map(seg => `
-                            <div class="segment">
-                                <div class="timestamp">[${seg.start} - ${seg.end}]</div>
-                                <div>${seg.text}</div>
-                            </div>
-                        `).join('')}
-                    </div>
-                `;
+                const stat = (label, value) => {
+                    const line = document.createElement('p');
+                    line.append(createElement('strong', '', label), ` ${value}`);
+                    return line;
+                };
+                speakerCard.append(
+                    createElement('h3', '', `🎭 ${speaker.label}`),
+                    stat('Temps de parole:', `${formatTime(speaker.total_duration)} (${Math.round(100 * speaker.total_duration / totalDuration)}%)`),
+                    stat('Segments:', speaker.segments),
+                );
+                
+                // Empreinte vocale: le nom donné sera repris dans les prochains enregistrements
+                if (speaker.voiceprint !== undefined) {
+                    const nameBtn = document.createElement('button');
+                    nameBtn.className = 'name-btn';
+                    nameBtn.textContent = speaker.diarization_label ? '✏️ Renommer' : '✏️ Nommer';
+                    nameBtn.onclick = () => nameSpeaker(data, index);
+                    speakerCard.appendChild(nameBtn);
+                }
                 
                 speakersSection.appendChild(speakerCard);
             });
             
             document.getElementById('results').style.display = 'block';
-            
-            // Auto-scroll to bottom of chat
-            chatContainer.scrollTop = chatContainer.scrollHeight;
         }
     </script>
 </body>
 </html>
 '''
 
-@app.route('/')
-def index():
-    return render_template_string(HTML_TEMPLATE)
-
-@app.route('/process', methods=['POST'])
-def process_audio():
-    try:
-        file = request.files['audio']
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
-        file.save(filepath)
-        
-        print(f"🎵 Traitement de {filepath}...")
-        
-        # 1. Transcription avec Whisper
-        print("📝 Transcription...")
-        # Auto-détection de la langue ou français par défaut
-        result = whisper_model.transcribe(filepath, language=None)  # Auto-detect
-        detected_language = result.get('language', 'fr')
-        print(f"🌍 Langue détectée: {detected_language}")
-        
-        # Si pas français, re-transcrire en français
-        if detected_language != 'fr':
-            print("🔄 Re-transcription en français...")
-            result = whisper_model.transcribe(filepath, language="fr")
-        
-        # 2. Diarisation avec pyannote (si disponible)
-        if diarization_pipeline:
-            print("👥 Identification des locuteurs...")
-            diarization = diarization_pipeline(filepath)
-        else:
-            print("⚠️ Diarisation non disponible - attribution automatique")
-            diarization = None
-        
-        # 3. Fusion des résultats
-        print("🔗 Fusion des données...")
-        segments_with_speakers = []
-        
-        # Détection du nombre de locuteurs basée sur la diarisation
-        unique_speakers = set()
-        if diarization:
-            for turn, _, speaker in diarization.itertracks(yield_label=True):
-                unique_speakers.add(speaker)
-            num_speakers = len(unique_speakers)
-            
-            if num_speakers == 1:
-                print(f"🎤 MONO-LOCUTEUR détecté: {list(unique_speakers)[0]}")
-            else:
-                print(f"👥 {num_speakers} LOCUTEURS détectés: {list(unique_speakers)}")
-        else:
-            # Sans diarisation, on assume 2 locuteurs (stéréo)
-            num_speakers = 2
-            print("👥 Mode STÉRÉO: 2 locuteurs assumés (pas de diarisation)")
-        
-        for i, segment in enumerate(result["segments"]):
-            seg_start = segment["start"]
-            seg_end = segment["end"]
-            
-            # Trouver le locuteur pour ce segment
-            if diarization:
-                speaker_label = "Locuteur_Inconnu"
-                for turn, _, speaker in diarization.itertracks(yield_label=True):
-                    if turn.start <= seg_start <= turn.end or turn.start <= seg_end <= turn.end:
-                        speaker_label = speaker
-                        break
-                
-                # Si vraiment 1 seul locuteur détecté, renommer
-                if num_speakers == 1:
-                    speaker_label = "ORATEUR_PRINCIPAL"
+
+DIARIZATION_MODEL_NAME = "pyannote/speaker-diarization"
+
+
+def create_app(config=None):
+    """
+    Construit l'application et ses composants (modèles, caches, file de
+    tâches). Chargée une fois dans le processus maître de gunicorn puis
+    forkée dans chaque worker (gunicorn.conf.py); `config` complète
+    app.config (dossiers de travail...).
+    """
+    app = Flask(__name__)
+    app.request_class = UploadRequest
+    app.config['UPLOAD_FOLDER'] = 'uploads'
+    app.config['AUDIO_CACHE_FOLDER'] = os.path.join('cache', 'audio')
+    app.config['RESULT_CACHE_FOLDER'] = os.path.join('cache', 'results')
+    app.config['PROFILE_FOLDER'] = 'profiles'
+    app.config['VOICEPRINT_FOLDER'] = 'voiceprints'
+    # État des tâches partagé entre les workers du serveur de production
+    app.config['JOB_STATE_FOLDER'] = os.path.join('cache', 'jobs')
+    app.config.update(config or {})
+
+    # Spans JSON par étape (SPAN_LOG: chemin d'un fichier JSONL, ou "-" pour la sortie d'erreur)
+    span_log = os.environ.get("SPAN_LOG")
+    if span_log:
+        span_handler = logging.StreamHandler() if span_log == "-" else logging.FileHandler(span_log, encoding="utf-8")
+        span_handler.setFormatter(logging.Formatter("%(message)s"))
+        logging.getLogger("diarisation.spans").addHandler(span_handler)
+        logging.getLogger("diarisation.spans").setLevel(logging.INFO)
+
+    # Profilage à la demande (champ `profile`: cpu ou torch), désactivé par défaut
+    profiling_enabled = os.environ.get("PROFILING_ENABLED", "0") == "1"
+
+    # Uploads écrits par blocs sous un nom unique et hachés à la réception
+    # (UPLOAD_MAX_MB, UPLOAD_RETENTION_HOURS, UPLOAD_MAX_TOTAL_MB, UPLOAD_DELETE_AFTER)
+    uploads = UploadStore(
+        app.config['UPLOAD_FOLDER'],
+        max_file_bytes=int(os.environ.get("UPLOAD_MAX_MB", 500)) * 1024 * 1024,
+        retention_seconds=float(os.environ.get("UPLOAD_RETENTION_HOURS", 24)) * 3600,
+        max_total_bytes=int(os.environ.get("UPLOAD_MAX_TOTAL_MB", 10240)) * 1024 * 1024,
+        delete_after_processing=os.environ.get("UPLOAD_DELETE_AFTER", "0") == "1",
+    )
+    app.extensions['upload_store'] = uploads
+    # Marge pour l'enveloppe multipart et les autres champs du formulaire
+    app.config['MAX_CONTENT_LENGTH'] = uploads.max_file_bytes + 1024 * 1024
+
+    hf_token = os.environ.get("HF_AUTH_TOKEN")
+    print(f"🔑 Token HF: {hf_token[:10]}..." if hf_token else "❌ Pas de token HF (diarisation désactivée)")
+
+    # MODEL_BACKEND=stub: modèles factices déterministes (stub_models), sans
+    # téléchargement ni token HF, pour tester ou mesurer le reste du pipeline
+    model_loaders = {}
+    if os.environ.get("MODEL_BACKEND") == "stub":
+        from stub_models import StubDiarization, StubWhisper
+        model_loaders = {"whisper_loader": lambda *args: StubWhisper(), "diarization_loader": StubDiarization}
+        print("🧪 Modèles factices (MODEL_BACKEND=stub)")
+
+    # Modèles chargés au premier usage puis déchargés après MODEL_IDLE_TTL secondes d'inactivité
+    # (WHISPER_MODEL: taille par défaut, WHISPER_MODELS: tailles autorisées par requête,
+    # WHISPER_QUANTIZE=1: variante int8 pour CPU)
+    models = ModelRegistry(
+        default_whisper=os.environ.get("WHISPER_MODEL", "large-v3"),
+        allowed_sizes=os.environ.get("WHISPER_MODELS", ",".join(WHISPER_SIZES)).split(","),
+        quantize=os.environ.get("WHISPER_QUANTIZE", "0") == "1",
+        diarization_name=DIARIZATION_MODEL_NAME,
+        hf_token=hf_token,
+        ttl=int(os.environ.get("MODEL_IDLE_TTL", 1800)),
+        **model_loaders,
+    )
+
+
+    # Politique de langue (WHISPER_LANGUAGE, WHISPER_LANGUAGES, WHISPER_FALLBACK_LANGUAGE)
+    language_policy = LanguagePolicy.from_env()
+
+    # Exécution des étapes (PIPELINE_PARALLEL, WHISPER_THREADS, DIARIZATION_THREADS)
+    # En parallèle, les cœurs sont partagés 2/3 Whisper, 1/3 pyannote par défaut
+    parallel_stages = os.environ.get("PIPELINE_PARALLEL", "0") == "1"
+    thread_budgets = {}
+
+    def configure_threads(cpu_count):
+        """Budgets de threads des étapes pour `cpu_count` cœurs (rappelé par chaque worker épinglé)"""
+        default_whisper_threads = max(1, cpu_count * 2 // 3) if parallel_stages else None
+        default_diarization_threads = max(1, cpu_count - cpu_count * 2 // 3) if parallel_stages else None
+        thread_budgets.update({
+            "transcribe": int(os.environ.get("WHISPER_THREADS") or 0) or default_whisper_threads,
+            "diarize": int(os.environ.get("DIARIZATION_THREADS") or 0) or default_diarization_threads,
+        })
+
+    configure_threads(len(available_cpus()))
+    app.extensions['configure_threads'] = configure_threads
+
+    # Attribution des locuteurs mot à mot (WORD_SPEAKERS=1): timestamps des mots
+    # demandés à Whisper et segments re-découpés aux changements de locuteur
+    word_speakers = os.environ.get("WORD_SPEAKERS", "0") == "1"
+
+    # Empreintes vocales persistantes (VOICEPRINTS=1): les locuteurs diarisés sont
+    # reconnus d'un enregistrement à l'autre et reprennent le nom qui leur a été donné
+    # (VOICEPRINT_THRESHOLD: similarité cosinus minimale, VOICEPRINT_ANN_MIN_ROWS:
+    # taille à partir de laquelle la recherche passe par un index approximatif faiss)
+    voiceprints = VoiceprintIndex(
+        app.config['VOICEPRINT_FOLDER'],
+        threshold=float(os.environ.get("VOICEPRINT_THRESHOLD", 0.6)),
+        ann_min_rows=int(os.environ.get("VOICEPRINT_ANN_MIN_ROWS", 50000)),
+    ) if os.environ.get("VOICEPRINTS", "0") == "1" else None
+
+    # Mode enregistrements longs (LONG_AUDIO_WORKERS=0 le désactive)
+    # Chaque worker charge son propre modèle: prévoir la mémoire en conséquence
+    long_audio_workers = int(os.environ.get("LONG_AUDIO_WORKERS", 0))
+    long_audio = ChunkedTranscriber(
+        models.default_whisper,
+        quantize=models.quantize,
+        workers=long_audio_workers,
+        chunk_seconds=int(os.environ.get("LONG_AUDIO_CHUNK_SECONDS", 300)),
+        min_seconds=int(os.environ.get("LONG_AUDIO_MIN_SECONDS", 600)),
+    ) if long_audio_workers > 0 else None
+
+    # Cache de résultats (RESULT_CACHE_MAX_MB, RESULT_CACHE_INTERMEDIATES)
+    result_cache = ResultCache(
+        app.config['RESULT_CACHE_FOLDER'],
+        max_bytes=int(os.environ.get("RESULT_CACHE_MAX_MB", 2048)) * 1024 * 1024,
+        store_intermediates=os.environ.get("RESULT_CACHE_INTERMEDIATES", "0") == "1",
+    )
+
+    def cache_key_for(upload, whisper_key, stream=False):
+        """
+        Clé du résultat. Le flux (fenêtres successives, sans morceaux parallèles
+        ni locuteurs mot à mot) a ses propres entrées, jamais servies à /process
+        """
+        if stream:
+            return make_key(
+                upload.digest,
+                format=RESULT_FORMAT_VERSION,
+                mode='stream',
+                whisper=whisper_key,
+                diarization=DIARIZATION_MODEL_NAME if models.diarization_enabled else None,
+                language=language_policy.settings(),
+                voiceprints=voiceprints is not None,
+            )
+        return make_key(
+            upload.digest,
+            format=RESULT_FORMAT_VERSION,
+            whisper=whisper_key,
+            diarization=DIARIZATION_MODEL_NAME if models.diarization_enabled else None,
+            language=language_policy.settings(),
+            long_audio=long_audio.settings() if long_audio else None,
+            word_speakers=word_speakers,
+            voiceprints=voiceprints is not None,
+        )
+
+    def long_audio_for(whisper_key):
+        """Le pool de transcription par morceaux ne sert que le modèle par défaut"""
+        if long_audio and whisper_key == models.whisper_key():
+            return long_audio
+        return None
+
+    def run_job(
+        upload, cache_key=None, model_name=None, quantize=None, profile=None, progress=None, wait=True, admitted=False,
+    ):
+        """
+        Traitement complet, servi depuis le cache si possible. Un calcul occupe
+        une place d'inférence: attendue, ou SlotsFull sans `wait`; avec
+        `admitted`, l'appelant (la file de tâches) l'a déjà prise.
+        """
+        whisper_key = models.whisper_key(model_name, quantize)
+        # Le nom unique de l'upload identifie la requête dans les spans et les profils
+        request_id = Path(upload.path).stem
+        profile_path = None
+
+        def compute():
+            nonlocal profile_path
+            intermediates = {}
+            try:
+                with nullcontext() if admitted else inference_slots.hold(blocking=wait), \
+                        models.whisper(model_name, quantize) as whisper_model, \
+                        models.diarization() as diarization_pipeline:
+                    with profiled(profile, app.config['PROFILE_FOLDER'], request_id) as profile_path:
+                        result = run_pipeline(
+                            upload.path, whisper_model, diarization_pipeline, progress,
+                            audio_cache=app.config['AUDIO_CACHE_FOLDER'],
+                            language_policy=language_policy,
+                            intermediates=intermediates,
+                            # cProfile ne suit que le thread qui l'active: étapes en séquence sous profil cpu
+                            parallel=parallel_stages and profile != 'cpu',
+                            thread_budgets=thread_budgets,
+                            long_audio=long_audio_for(whisper_key),
+                            word_speakers=word_speakers,
+                            voiceprints=voiceprints,
+                        )
+            except JobCancelled:
+                metrics.requests.inc(mode=pipeline_mode(), status="cancelled")
+                raise
+            except SlotsFull:
+                raise
+            except Exception:
+                metrics.record_failure(pipeline_mode())
+                raise
+            metrics.record(request_id, result)
+            result['model'] = whisper_key
+            return result, intermediates
+
+        key = cache_key or cache_key_for(upload, whisper_key)
+        try:
+            if profile:
+                # Une requête profilée est toujours recalculée
+                result, intermediates = compute()
+                result_cache.put(key, result, intermediates)
+                hit = False
             else:
-                # Sans diarisation: mode stéréo (2 locuteurs)
-                speaker_label = f"SPEAKER_{i % 2:02d}"
-            
-            segments_with_speakers.append({
-                "start": str(timedelta(seconds=int(seg_start))),
-                "end": str(timedelta(seconds=int(seg_end))),
-                "text": segment["text"].strip(),
-                "speaker": speaker_label
-            })
-        
-        # 4. Analyse par locuteur
-        speakers_analysis = {}
-        for segment in segments_with_speakers:
-            speaker = segment["speaker"]
-            if speaker not in speakers_analysis:
-                speakers_analysis[speaker] = {
-                    "segments": [],
-                    "total_duration": 0
-                }
-            
-            speakers_analysis[speaker]["segments"].append(segment)
-            # Calculer durée approximative
-            start_parts = segment["start"].split(":")
-            end_parts = segment["end"].split(":")
-            start_seconds = int(start_parts[0])*3600 + int(start_parts[1])*60 + int(start_parts[2])
-            end_seconds = int(end_parts[0])*3600 + int(end_parts[1])*60 + int(end_parts[2])
-            speakers_analysis[speaker]["total_duration"] += (end_seconds - start_seconds)
-        
-        # Formater les durées
-        for speaker in speakers_analysis:
-            duration = speakers_analysis[speaker]["total_duration"]
-            speakers_analysis[speaker]["duration"] = str(timedelta(seconds=duration))
-        
-        # 5. Transcript complet
-        full_transcript = "\n".join([
-            f"[{seg['start']} - {seg['end']}] {seg['speaker']}: {seg['text']}"
-            for seg in segments_with_speakers
-        ])
-        
-        print("✅ Traitement terminé!")
-        
+                result, hit = result_cache.get_or_compute(key, compute)
+        finally:
+            uploads.release(upload)
+        if hit:
+            metrics.record_cache_hit()
+            print(f"⚡ Résultat servi depuis le cache pour {upload.original_name}")
+        if profile_path:
+            return {**result, 'cached': hit, 'result_id': key, 'profile': profile_path}
+        return {**result, 'cached': hit, 'result_id': key}
+
+    def named(result):
+        """Résultat servi avec le nom courant des locuteurs reconnus par leur empreinte"""
+        return voiceprints.apply_names(result) if voiceprints else result
+
+    def pipeline_mode():
+        return 'parallel' if parallel_stages and models.diarization_enabled else 'sequential'
+
+    # Segments renvoyés avec un résultat de tâche ou de flux; la suite est
+    # paginée via /results/<id>/segments (SEGMENTS_PAGE_SIZE)
+    segments_page_size = int(os.environ.get("SEGMENTS_PAGE_SIZE", 500))
+
+    # Places d'inférence du processus (MAX_CONCURRENT_JOBS), partagées par la
+    # file de tâches, /process et les flux: au-delà, /process et les flux sont
+    # refusés en 429 avec une estimation Retry-After
+    inference_slots = InferenceSlots(int(os.environ.get("MAX_CONCURRENT_JOBS", 1)))
+
+    def busy(retry_after, endpoint, error="Serveur occupé"):
+        """Réponse 429: le client réessaie après `retry_after` secondes"""
+        metrics.rejected.inc(endpoint=endpoint)
+        response = jsonify({'success': False, 'error': f"{error}, réessayez dans {retry_after} s", 'retry_after': retry_after})
+        response.status_code = 429
+        response.headers['Retry-After'] = str(retry_after)
+        return response
+
+    # Mode direct (WebSocket /live): modèle léger pour tenir la latence sur CPU,
+    # fenêtre glissante bornée (LIVE_WHISPER_MODEL, LIVE_MAX_SESSIONS, LIVE_WINDOW_SECONDS,
+    # LIVE_STEP_SECONDS, LIVE_SPEAKER_THRESHOLD)
+    live_whisper_model = os.environ.get("LIVE_WHISPER_MODEL", "small")
+    live_slots = InferenceSlots(int(os.environ.get("LIVE_MAX_SESSIONS", 1)))
+    live_settings = {
+        "window_seconds": float(os.environ.get("LIVE_WINDOW_SECONDS", 15)),
+        "step_seconds": float(os.environ.get("LIVE_STEP_SECONDS", 1)),
+    }
+    live_speaker_threshold = float(os.environ.get("LIVE_SPEAKER_THRESHOLD", 0.5))
+
+    # File de tâches: concurrence bornée pour ne pas surcharger les modèles; une
+    # tâche reste en file tant qu'elle n'a pas obtenu de place d'inférence
+    job_queue = JobQueue(
+        partial(run_job, admitted=True),
+        max_workers=int(os.environ.get("MAX_CONCURRENT_JOBS", 1)),
+        max_queued=int(os.environ.get("MAX_QUEUED_JOBS", 32)),
+        state_dir=app.config['JOB_STATE_FOLDER'],
+        admit=inference_slots.hold,
+    )
+
+    metrics = Metrics(queue_depth=job_queue.depth, slots_busy=lambda: inference_slots.busy)
+
+    # Préchargement (PRELOAD_MODELS=1, activé par gunicorn.conf.py): modèle Whisper
+    # par défaut (ou PRELOAD_WHISPER_MODELS) et diarisation chargés avant le fork,
+    # partagés en copie sur écriture par tous les workers et jamais déchargés
+    if os.environ.get("PRELOAD_MODELS", "0") == "1":
+        preload_sizes = [size for size in os.environ.get("PRELOAD_WHISPER_MODELS", "").split(",") if size]
+        print(f"📦 Modèles préchargés: {', '.join(models.preload(preload_sizes))}")
+
+    @app.route('/')
+    def index():
+        return render_template_string(
+            HTML_TEMPLATE, model_sizes=models.allowed_sizes, default_model=models.default_whisper,
+            max_upload_mb=uploads.max_file_bytes // (1024 * 1024), live_enabled=Sock is not None,
+        )
+
+    def model_options():
+        """Taille Whisper et quantification demandées (champs `model` et `quantize`)"""
+        model_name = request.form.get('model') or None
+        quantize = request.form.get('quantize')
+        quantize = None if quantize is None else quantize in ('1', 'true', 'on')
+        return model_name, quantize, models.whisper_key(model_name, quantize)
+
+    def profile_option():
+        """Profilage demandé pour cette requête (champ `profile`: cpu ou torch)"""
+        kind = request.form.get('profile') or None
+        if kind is None:
+            return None
+        if not profiling_enabled:
+            raise ValueError("Profilage désactivé (PROFILING_ENABLED=1 pour l'activer)")
+        if kind not in ('cpu', 'torch'):
+            raise ValueError(f"Profilage inconnu: {kind} (choix: cpu, torch)")
+        return kind
+
+    def discard_uploads(keep=()):
+        """Supprime les fichiers reçus dans les champs hors de `keep` (requête refusée, champ inattendu)"""
+        for field, file_storage in request.files.items(multi=True):
+            if field not in keep:
+                uploads.discard(file_storage)
+
+    def request_options():
+        """model_options() et profile_option(); fichiers reçus supprimés si les options sont refusées"""
+        try:
+            return (*model_options(), profile_option())
+        except ValueError:
+            discard_uploads()
+            raise
+
+    def save_upload():
+        """Upload déjà écrit et haché pendant la lecture du formulaire (seul le champ `audio` est gardé)"""
+        discard_uploads(keep=('audio',))
+        with metrics.timed('upload'):
+            upload = uploads.adopt(request.files['audio'])
+        print(f"📥 {upload.original_name}: {upload.size / 1024 ** 2:.1f} MB reçus")
+        return upload
+
+    @app.errorhandler(RequestEntityTooLarge)
+    def upload_too_large(e):
+        max_mb = uploads.max_file_bytes // (1024 * 1024)
+        return jsonify({'success': False, 'error': f"Fichier trop volumineux (max {max_mb} MB)"}), 413
+
+    @app.route('/process', methods=['POST'])
+    def process_audio():
+        try:
+            model_name, quantize, _, profile = request_options()
+            upload = save_upload()
+
+            result = run_job(upload, model_name=model_name, quantize=quantize, profile=profile, wait=False)
+
+            with metrics.timed('serialize'):
+                return jsonify({'success': True, **named(result)})
+
+        except SlotsFull as e:
+            return busy(e.retry_after, 'process')
+        except RequestEntityTooLarge:
+            raise
+        except Exception as e:
+            print(f"❌ Erreur: {e}")
+            import traceback
+            traceback.print_exc()
+            return jsonify({'success': False, 'error': str(e)})
+
+    @app.route('/process/stream', methods=['POST'])
+    def process_audio_stream():
+        try:
+            model_name, quantize, whisper_key = model_options()
+        except ValueError as e:
+            discard_uploads()
+            return jsonify({'success': False, 'error': str(e)}), 400
+        upload = save_upload()
+        cache_key = cache_key_for(upload, whisper_key, stream=True)
+        cached = result_cache.get(cache_key)
+        slot = None
+        if cached is None:
+            # Place prise avant d'ouvrir le flux: le refus peut encore être un 429
+            try:
+                slot = inference_slots.try_acquire()
+            except SlotsFull as e:
+                uploads.release(upload)
+                return busy(e.retry_after, 'stream')
+        released = []
+
+        def release():
+            # Fin du flux ou client parti avant son début: une seule libération
+            if not released:
+                released.append(True)
+                if slot is not None:
+                    inference_slots.release(slot)
+                uploads.release(upload)
+
+        def events():
+            if cached is not None:
+                release()
+                metrics.record_cache_hit()
+                print(f"⚡ Résultat servi depuis le cache pour {upload.original_name}")
+                served = named(cached)
+                for event in stream_cached(served):
+                    if event['type'] == 'done':
+                        event['result'] = page({**served, 'cached': True, 'result_id': cache_key}, 0, segments_page_size)
+                    yield event
+                return
+
+            try:
+                intermediates = {}
+                with models.whisper(model_name, quantize) as whisper_model, models.diarization() as diarization_pipeline:
+                    # Fermé explicitement (client parti): la diarisation est arrêtée avant de rendre la place
+                    with closing(stream_pipeline(
+                        upload.path, whisper_model, diarization_pipeline,
+                        audio_cache=app.config['AUDIO_CACHE_FOLDER'],
+                        language_policy=language_policy,
+                        intermediates=intermediates,
+                        voiceprints=voiceprints,
+                    )) as stream:
+                        for event in stream:
+                            if event['type'] == 'done':
+                                metrics.record(Path(upload.path).stem, event['result'])
+                                event['result']['model'] = whisper_key
+                                result_cache.put(cache_key, event['result'], intermediates)
+                                # Le client a déjà reçu tous les segments: seule la première page est renvoyée
+                                event['result'] = page(
+                                    {**named(event['result']), 'cached': False, 'result_id': cache_key}, 0, segments_page_size
+                                )
+                            yield event
+            except Exception as e:
+                metrics.record_failure('streaming')
+                print(f"❌ Erreur: {e}")
+                yield {'type': 'error', 'error': str(e)}
+            finally:
+                release()
+
+        response = Response(
+            to_ndjson(events()),
+            mimetype='application/x-ndjson',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+        )
+        response.call_on_close(release)
+        return response
+
+    @app.route('/jobs', methods=['POST'])
+    def create_job():
+        try:
+            model_name, quantize, whisper_key, profile = request_options()
+            upload = save_upload()
+            cache_key = cache_key_for(upload, whisper_key)
+            cached = None if profile else result_cache.get(cache_key)
+            if cached is not None:
+                uploads.release(upload)
+                metrics.record_cache_hit()
+                print(f"⚡ Résultat servi depuis le cache pour {upload.original_name}")
+                result = page({**named(cached), 'cached': True, 'result_id': cache_key}, 0, segments_page_size)
+                return jsonify({'success': True, 'status': 'done', 'progress': 100, 'result': result})
+
+            try:
+                job = job_queue.submit(upload, cache_key, model_name, quantize, profile)
+            except QueueFull:
+                # Tâche refusée: l'upload n'est plus en cours de traitement
+                uploads.release(upload)
+                raise
+            print(f"📥 Tâche {job.id} en file pour {upload.original_name}")
+            return jsonify({'success': True, **job.to_dict(job_queue.position(job))}), 202
+        except QueueFull as e:
+            return busy(inference_slots.retry_after(job_queue.depth()), 'jobs', f"File d'attente pleine ({e})")
+        except RequestEntityTooLarge:
+            raise
+        except Exception as e:
+            print(f"❌ Erreur: {e}")
+            return jsonify({'success': False, 'error': str(e)}), 400
+
+    @app.route('/jobs/<job_id>', methods=['GET'])
+    def get_job(job_id):
+        # Tâche de ce worker ou, via le dossier d'état partagé, d'un autre
+        data = job_queue.describe(job_id)
+        if data is None:
+            return jsonify({'success': False, 'error': 'Tâche inconnue'}), 404
+        if data.get('result'):
+            data['result'] = page(named(data['result']), 0, segments_page_size)
+        return jsonify({'success': True, **data})
+
+    @app.route('/jobs/<job_id>', methods=['DELETE'])
+    def cancel_job(job_id):
+        if not job_queue.cancel(job_id):
+            return jsonify({'success': False, 'error': 'Tâche inconnue ou déjà terminée'}), 404
+        return jsonify({'success': True, 'job_id': job_id})
+
+    @app.route('/results/<result_id>/segments', methods=['GET'])
+    def result_segments(result_id):
+        result = result_cache.get(result_id)
+        if result is None:
+            return jsonify({'success': False, 'error': 'Résultat inconnu ou expiré'}), 404
+        result = named(result)
+        offset = max(request.args.get('offset', 0, type=int), 0)
+        limit = min(max(request.args.get('limit', segments_page_size, type=int), 1), 5000)
+        paged = page(result, offset, limit)
+        return jsonify({
+            'success': True,
+            'result_id': result_id,
+            'speakers': [speaker['label'] for speaker in result['speakers']],
+            'segments': paged['segments'],
+            'segments_total': paged['segments_total'],
+            'segments_offset': offset,
+            'next_offset': paged['next_offset'],
+        })
+
+    @app.route('/results/<result_id>/transcript', methods=['GET'])
+    def result_transcript(result_id):
+        result = result_cache.get(result_id)
+        if result is None:
+            return jsonify({'success': False, 'error': 'Résultat inconnu ou expiré'}), 404
+        return Response(transcript(named(result)), mimetype='text/plain; charset=utf-8')
+
+    @app.route('/voiceprints', methods=['GET'])
+    def voiceprint_stats():
+        if voiceprints is None:
+            return jsonify({'success': False, 'error': 'Empreintes vocales désactivées (VOICEPRINTS=1)'}), 404
+        return jsonify({'success': True, **voiceprints.stats()})
+
+    @app.route('/voiceprints/<int:row>', methods=['PUT'])
+    def name_voiceprint(row):
+        """Nomme le locuteur d'une empreinte (champ `voiceprint` des locuteurs d'un résultat)"""
+        if voiceprints is None:
+            return jsonify({'success': False, 'error': 'Empreintes vocales désactivées (VOICEPRINTS=1)'}), 404
+        name = (request.get_json(silent=True) or {}).get('name') or ''
+        if not isinstance(name, str) or len(name) > 100:
+            return jsonify({'success': False, 'error': 'Nom invalide (texte de 100 caractères au plus)'}), 400
+        name = name.strip()
+        try:
+            speaker = voiceprints.name(row, name)
+        except KeyError:
+            return jsonify({'success': False, 'error': 'Empreinte inconnue'}), 404
+        print(f"🔖 Empreinte {row}: " + (f"nommée {name}" if name else "nom effacé"))
+        return jsonify({'success': True, 'voiceprint': row, 'speaker': speaker, 'name': name or None})
+
+    def live_transcription(ws):
+        """
+        Micro en direct. Le client envoie du PCM 16 bits mono 16 kHz en messages
+        binaires puis {"type": "stop"}; le serveur répond ready, partial, segment
+        et done (résultat complet), ou error.
+        """
+        model_name = request.args.get('model') or live_whisper_model
+        language = request.args.get('language') or language_policy.force or language_policy.fallback
+        try:
+            whisper_key = models.whisper_key(model_name, False)
+        except ValueError as e:
+            ws.send(json.dumps({'type': 'error', 'error': str(e)}))
+            return
+        try:
+            slot = live_slots.try_acquire()
+        except SlotsFull as e:
+            metrics.rejected.inc(endpoint='live')
+            ws.send(json.dumps({'type': 'error', 'error': 'Trop de sessions en direct, réessayez plus tard', 'retry_after': e.retry_after}))
+            return
+        try:
+            with models.whisper(model_name, False) as whisper_model, models.diarization() as diarization_pipeline:
+                session = LiveSession(
+                    whisper_model, language,
+                    embed=speaker_embedder(diarization_pipeline),
+                    tracker=SpeakerTracker(threshold=live_speaker_threshold),
+                    **live_settings,
+                )
+                ws.send(json.dumps({'type': 'ready', 'sample_rate': SAMPLE_RATE, 'model': whisper_key, 'language': language}))
+                print(f"🎙️ Session en direct ouverte ({whisper_key}, {language})")
+                stopped = False
+                while not stopped:
+                    # Bloque jusqu'au prochain message puis vide ce qui est arrivé
+                    # pendant la passe précédente: une seule passe Whisper pour tout le retard
+                    message = ws.receive()
+                    while message is not None:
+                        if isinstance(message, str):
+                            stopped = json.loads(message).get('type') == 'stop'
+                            if stopped:
+                                break
+                        else:
+                            session.feed(message)
+                        message = ws.receive(timeout=0)
+                    if stopped:
+                        events = session.finish()
+                    elif session.ready():
+                        events = session.process()
+                    else:
+                        events = []
+                    for event in events:
+                        ws.send(json.dumps(event, ensure_ascii=False))
+                metrics.requests.inc(mode='live', status='done')
+                print(f"✅ Session en direct terminée: {len(session.segments)} segments, {session.stream_seconds:.0f} s d'audio")
+        except Exception as e:
+            if not ws.connected:
+                print("🔌 Session en direct interrompue par le client")
+                return
+            metrics.record_failure('live')
+            print(f"❌ Erreur: {e}")
+            ws.send(json.dumps({'type': 'error', 'error': str(e)}))
+        finally:
+            live_slots.release(slot)
+
+    if Sock is not None:
+        Sock(app).route('/live')(live_transcription)
+    else:
+        print("⚠️ flask-sock absent: mode direct (/live) désactivé")
+
+    @app.route('/models', methods=['GET'])
+    def list_models():
         return jsonify({
             'success': True,
-            'full_transcript': full_transcript,
-            'speakers': speakers_analysis,
-            'segments': segments_with_speakers
+            'default': models.whisper_key(),
+            'allowed': list(models.allowed_sizes),
+            'loaded': models.stats(),
         })
-        
-    except Exception as e:
-        print(f"❌ Erreur: {e}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({'success': False, 'error': str(e)})
+
+    @app.route('/metrics', methods=['GET'])
+    def prometheus_metrics():
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+    return app
+
 
 if __name__ == '__main__':
-    app.run(debug=True, port=5002)
\ No newline at end of file
+    create_app().run(debug=True, port=5002)
@@ -0,0 +1,245 @@
+"""
+Instrumentation du pipeline
+Spans de durée par étape (journal JSON), compteurs et histogrammes exposés au
+format texte Prometheus sur /metrics, et profilage optionnel d'une requête
+(cProfile ou profiler torch)
+"""
+
+import cProfile
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from model_registry import rss_bytes
+
+span_logger = logging.getLogger("diarisation.spans")
+
+# Étapes de run_pipeline mesurées individuellement
+PIPELINE_STAGES = ("decode", "language", "transcribe", "diarize", "merge", "speaker_analysis", "voiceprints")
+
+STAGE_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600, 1800)
+RTF_BUCKETS = (0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5)
+AUDIO_BUCKETS = (10, 30, 60, 300, 600, 1800, 3600, 7200, 14400)
+SPEAKER_BUCKETS = (1, 2, 3, 4, 5, 6, 8, 10)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{str(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {} if labels else {(): 0}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}")
+        return lines
+
+
+class Gauge:
+    """Valeur instantanée, lue par `getter` au moment du rendu"""
+
+    def __init__(self, name, documentation, getter):
+        self.name = name
+        self.documentation = documentation
+        self.getter = getter
+
+    def render(self):
+        value = self.getter()
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        if value is not None:
+            lines.append(f"{self.name} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, buckets, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets) + (float("inf"),)
+        self.labels = tuple(labels)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            counts, total = self._series.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._series[key] = (counts, total + value)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total) in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, counts):
+                    labels = _format_labels(self.labels + ("le",), key + (_format_value(bound),))
+                    lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = _format_labels(self.labels, key)
+                lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+                lines.append(f"{self.name}_count{labels} {counts[-1]}")
+        return lines
+
+
+def peak_rss_bytes():
+    """Pic de mémoire résidente du processus (Unix), None ailleurs"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss est en kilo-octets sous Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class Metrics:
+    """
+    Registre des métriques de l'application.
+
+    `queue_depth` est une fonction renvoyant le nombre de tâches en attente,
+    `slots_busy` le nombre de places d'inférence occupées. Avec plusieurs
+    workers, chaque processus a son registre: /metrics décrit celui qui répond.
+    """
+
+    def __init__(self, queue_depth=None, slots_busy=None):
+        self.requests = Counter(
+            "diarisation_requests_total", "Traitements terminés par mode et statut", ("mode", "status")
+        )
+        self.cache_hits = Counter("diarisation_cache_hits_total", "Résultats servis depuis le cache")
+        self.rejected = Counter(
+            "diarisation_rejected_total", "Requêtes refusées faute de place d'inférence (429)", ("endpoint",)
+        )
+        self.stage_seconds = Histogram(
+            "diarisation_stage_seconds", "Durée de chaque étape du pipeline", STAGE_BUCKETS, ("stage",)
+        )
+        self.realtime_factor = Histogram(
+            "diarisation_realtime_factor", "Temps de traitement / durée de l'audio", RTF_BUCKETS, ("mode",)
+        )
+        self.audio_seconds = Histogram(
+            "diarisation_audio_seconds", "Durée des fichiers audio traités", AUDIO_BUCKETS
+        )
+        self.speakers = Histogram("diarisation_speakers", "Nombre de locuteurs détectés", SPEAKER_BUCKETS)
+        self.gauges = [
+            Gauge("diarisation_queue_depth", "Tâches en attente dans la file", queue_depth or (lambda: None)),
+            Gauge("diarisation_inference_slots_busy", "Places d'inférence occupées", slots_busy or (lambda: None)),
+            Gauge("process_resident_memory_bytes", "Mémoire résidente du processus", rss_bytes),
+            Gauge("process_peak_resident_memory_bytes", "Pic de mémoire résidente du processus", peak_rss_bytes),
+        ]
+
+    def record(self, request_id, result, mode=None):
+        """Enregistre un traitement terminé: un span par étape puis les métriques globales"""
+        timings = result.get("timings", {})
+        mode = mode or timings.get("mode", "unknown")
+        language = result.get("language") or {}
+        stages = {stage: timings.get(stage) for stage in PIPELINE_STAGES}
+        # La durée de l'étape transcribe inclut le choix de la langue: on les sépare
+        if language.get("detect_seconds") is not None:
+            stages["language"] = language["detect_seconds"]
+        if language.get("transcribe_seconds") is not None:
+            stages["transcribe"] = language["transcribe_seconds"]
+
+        for stage, seconds in stages.items():
+            if seconds is None:
+                continue
+            self.stage_seconds.observe(seconds, stage=stage)
+            span_logger.info(json.dumps({
+                "event": "span", "request_id": request_id, "mode": mode, "stage": stage, "seconds": seconds,
+            }))
+
+        total = timings.get("total")
+        audio_seconds = timings.get("audio_seconds")
+        if audio_seconds:
+            self.audio_seconds.observe(audio_seconds)
+            if total is not None:
+                self.realtime_factor.observe(total / audio_seconds, mode=mode)
+        self.speakers.observe(len(result.get("speakers", {})))
+        self.requests.inc(mode=mode, status="done")
+        span_logger.info(json.dumps({
+            "event": "request", "request_id": request_id, "mode": mode, "total_seconds": total,
+            "audio_seconds": audio_seconds, "speakers": len(result.get("speakers", {})),
+        }))
+
+    @contextmanager
+    def timed(self, stage):
+        """Span d'une étape hors pipeline (réception de l'upload, sérialisation...)"""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_seconds.observe(time.perf_counter() - t0, stage=stage)
+
+    def record_failure(self, mode):
+        self.requests.inc(mode=mode, status="failed")
+
+    def record_cache_hit(self):
+        self.cache_hits.inc()
+
+    def render(self):
+        """Exposition au format texte Prometheus (version 0.0.4)"""
+        lines = []
+        for metric in (
+            self.requests, self.cache_hits, self.rejected, self.stage_seconds, self.realtime_factor,
+            self.audio_seconds, self.speakers, *self.gauges,
+        ):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+@contextmanager
+def profiled(kind, directory, request_id):
+    """
+    Profile le bloc `with` si `kind` vaut "cpu" (cProfile, fichier .prof) ou
+    "torch" (profiler torch, trace Chrome .json). Produit le chemin du fichier
+    écrit, ou None sans profilage. cProfile ne voit que le thread courant: le
+    code profilé doit s'y exécuter (pas d'étapes en parallèle).
+    """
+    if not kind:
+        yield None
+        return
+    Path(directory).mkdir(parents=True, exist_ok=True)
+    if kind == "cpu":
+        path = Path(directory) / f"{request_id}.prof"
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield str(path)
+        finally:
+            profiler.disable()
+            profiler.dump_stats(path)
+            print(f"🔬 Profil cProfile écrit: {path}")
+    elif kind == "torch":
+        from torch.profiler import ProfilerActivity, profile
+
+        path = Path(directory) / f"{request_id}.json"
+        with profile(activities=[ProfilerActivity.CPU], record_shapes=True) as profiler:
+            yield str(path)
+        profiler.export_chrome_trace(str(path))
+        print(f"🔬 Trace torch écrite: {path}")
+    else:
+        raise ValueError(f"Profilage inconnu: {kind} (choix: cpu, torch)")
+
@@ -0,0 +1,277 @@
+"""
+Registre des modèles
+Chargement paresseux au premier usage, choix de la taille Whisper par requête,
+variante int8 quantifiée pour CPU et déchargement des modèles inactifs
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+WHISPER_SIZES = ("tiny", "base", "small", "medium", "large-v2", "large-v3")
+
+
+def tensor_bytes(module):
+    """Taille des poids et buffers (y compris les poids int8 empaquetés)"""
+    import torch
+
+    def size(value):
+        if isinstance(value, torch.Tensor):
+            return value.element_size() * value.nelement()
+        if isinstance(value, (tuple, list)):
+            return sum(size(v) for v in value)
+        return 0
+
+    return sum(size(value) for value in module.state_dict().values())
+
+
+def load_whisper(name, device=None, quantize=False):
+    """
+    Charge un modèle Whisper; avec `quantize`, les couches linéaires sont
+    quantifiées dynamiquement en int8 (CPU uniquement).
+    """
+    import torch
+    import whisper
+
+    if quantize:
+        device = "cpu"
+    model = whisper.load_model(name, device=device)
+    if quantize:
+        # quantize_dynamic ne reconnaît que nn.Linear exactement; la sous-classe
+        # de Whisper ne fait que convertir le dtype des poids, inutile en fp32
+        for module in model.modules():
+            if isinstance(module, torch.nn.Linear):
+                module.__class__ = torch.nn.Linear
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model.eval()
+
+
+def rss_bytes():
+    """Mémoire résidente du processus (Linux), None ailleurs"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+class _Entry:
+    def __init__(self, model, load_seconds, resident_bytes):
+        self.model = model
+        self.load_seconds = load_seconds
+        self.resident_bytes = resident_bytes
+        self.last_used = time.time()
+        self.in_use = 0
+        self.uses = 0
+        self.pinned = False
+
+
+class ModelRegistry:
+    """
+    Modèles chargés à la demande et partagés entre requêtes.
+
+    Les modèles inutilisés depuis plus de `ttl` secondes sont déchargés par un
+    thread de ménage (`ttl=0` les garde indéfiniment), démarré au premier
+    usage hors préchargement dans le processus qui s'en sert: le maître
+    gunicorn qui précharge n'en a pas, chaque worker forké démarre le sien, et
+    les verrous du registre sont recréés dans l'enfant après un fork.
+
+    `whisper_loader(taille, device, quantize)` et `diarization_loader()`
+    remplacent le chargement réel (par exemple par les modèles factices de
+    stub_models); un `diarization_loader` active la diarisation sans token HF.
+    """
+
+    def __init__(
+        self, default_whisper="large-v3", allowed_sizes=WHISPER_SIZES, quantize=False,
+        diarization_name="pyannote/speaker-diarization", hf_token=None, device=None, ttl=1800,
+        whisper_loader=None, diarization_loader=None,
+    ):
+        self.default_whisper = default_whisper
+        self.allowed_sizes = tuple(allowed_sizes)
+        self.quantize = quantize
+        self.diarization_name = diarization_name
+        self.hf_token = hf_token
+        self.device = device
+        self.ttl = ttl
+        self.whisper_loader = whisper_loader or load_whisper
+        self.diarization_loader = diarization_loader
+        # Dernier échec de chargement de pyannote (réseau, hub HF...), réessayé après `ttl`
+        self._diarization_failed_at = None
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self._janitor_pid = None
+        self._preloading = False
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reset_locks)
+
+    def _reset_locks(self):
+        # Un verrou pris par un thread du parent au moment du fork resterait pris à jamais dans l'enfant
+        self._lock = threading.Lock()
+        self._load_locks = {}
+
+    @property
+    def diarization_enabled(self):
+        available = bool(self.hf_token) or self.diarization_loader is not None
+        return available and not self.diarization_failed
+
+    @property
+    def diarization_failed(self):
+        """Échec de chargement récent: nouvel essai après `ttl` secondes (5 min si `ttl=0`)"""
+        if self._diarization_failed_at is None:
+            return False
+        return time.time() - self._diarization_failed_at < (self.ttl or 300)
+
+    def whisper_key(self, name=None, quantize=None):
+        """Identifiant du modèle Whisper demandé, après validation"""
+        name = name or self.default_whisper
+        if name not in self.allowed_sizes:
+            raise ValueError(f"Modèle Whisper non autorisé: {name} (choix: {', '.join(self.allowed_sizes)})")
+        quantize = self.quantize if quantize is None else quantize
+        return f"whisper:{name}" + (":int8" if quantize else "")
+
+    def _start_janitor(self):
+        # Les threads ne survivent pas à un fork: un par processus, jamais pendant
+        # le préchargement (maître gunicorn, où les modèles sont de toute façon épinglés)
+        if self.ttl and not self._preloading and self._janitor_pid != os.getpid():
+            self._janitor_pid = os.getpid()
+            threading.Thread(target=self._janitor, name="model-janitor", daemon=True).start()
+
+    def _get(self, key, loader):
+        with self._lock:
+            self._start_janitor()
+            entry = self._entries.get(key)
+            if entry is None:
+                load_lock = self._load_locks.setdefault(key, threading.Lock())
+        if entry is None:
+            # Un seul chargement par modèle, même si plusieurs requêtes arrivent ensemble
+            with load_lock:
+                with self._lock:
+                    entry = self._entries.get(key)
+                if entry is None:
+                    print(f"🔄 Chargement de {key}...")
+                    rss_before = rss_bytes()
+                    t0 = time.perf_counter()
+                    model = loader()
+                    load_seconds = time.perf_counter() - t0
+                    if hasattr(model, "state_dict"):
+                        resident = tensor_bytes(model)
+                    elif rss_before is not None:
+                        # Pipelines sans state_dict: croissance de la mémoire du processus
+                        resident = rss_bytes() - rss_before
+                    else:
+                        resident = None
+                    entry = _Entry(model, load_seconds, resident)
+                    print(f"✅ {key} chargé en {load_seconds:.1f} s")
+                    with self._lock:
+                        self._entries[key] = entry
+        with self._lock:
+            entry.in_use += 1
+            entry.uses += 1
+            entry.last_used = time.time()
+        return entry
+
+    def _release(self, entry):
+        with self._lock:
+            entry.in_use -= 1
+            entry.last_used = time.time()
+
+    @contextmanager
+    def whisper(self, name=None, quantize=None):
+        """Modèle Whisper prêt à l'emploi pendant le bloc `with`"""
+        key = self.whisper_key(name, quantize)
+        _, size, *variant = key.split(":")
+        entry = self._get(key, lambda: self.whisper_loader(size, self.device, bool(variant)))
+        try:
+            yield entry.model
+        finally:
+            self._release(entry)
+
+    def _load_diarization(self):
+        if self.diarization_loader is not None:
+            return self.diarization_loader()
+        from pyannote.audio import Pipeline
+
+        pipeline = Pipeline.from_pretrained(self.diarization_name, use_auth_token=self.hf_token)
+        if pipeline is None:
+            raise ValueError(f"Pipeline {self.diarization_name} introuvable")
+        return pipeline
+
+    @contextmanager
+    def diarization(self):
+        """Pipeline pyannote pendant le bloc `with`, ou None si indisponible"""
+        if not self.diarization_enabled:
+            yield None
+            return
+        try:
+            entry = self._get(f"pyannote:{self.diarization_name}", self._load_diarization)
+            self._diarization_failed_at = None
+        except Exception as e:
+            print(f"⚠️ Diarisation non disponible: {e}")
+            print("Utilisation du mode alternatif (attribution automatique)")
+            self._diarization_failed_at = time.time()
+            yield None
+            return
+        try:
+            yield entry.model
+        finally:
+            self._release(entry)
+
+    def preload(self, whisper_names=None):
+        """
+        Charge dès maintenant les modèles Whisper demandés (défaut: le modèle
+        par défaut) et la diarisation, et les garde indéfiniment. Appelé avant
+        le fork des workers, leurs poids sont partagés en copie sur écriture.
+        """
+        self._preloading = True
+        try:
+            for name in whisper_names or [self.default_whisper]:
+                with self.whisper(name):
+                    pass
+            with self.diarization():
+                pass
+        finally:
+            self._preloading = False
+        with self._lock:
+            for entry in self._entries.values():
+                entry.pinned = True
+        return list(self._entries)
+
+    def unload_idle(self):
+        """Décharge les modèles inutilisés depuis plus de `ttl` secondes (hors modèles préchargés)"""
+        limit = time.time() - self.ttl
+        with self._lock:
+            idle = [
+                key for key, entry in self._entries.items()
+                if entry.in_use == 0 and entry.last_used < limit and not entry.pinned
+            ]
+            for key in idle:
+                del self._entries[key]
+        for key in idle:
+            print(f"💤 {key} déchargé (inactif)")
+        if idle:
+            import gc
+            gc.collect()
+        return idle
+
+    def _janitor(self):
+        while True:
+            time.sleep(min(self.ttl, 60))
+            self.unload_idle()
+
+    def stats(self):
+        """Temps de chargement et taille résidente de chaque modèle chargé"""
+        with self._lock:
+            return [
+                {
+                    "model": key,
+                    "load_seconds": round(entry.load_seconds, 2),
+                    "resident_mb": round(entry.resident_bytes / 1024 ** 2, 1) if entry.resident_bytes else None,
+                    "in_use": entry.in_use,
+                    "uses": entry.uses,
+                    "idle_seconds": round(time.time() - entry.last_used, 1),
+                    "preloaded": entry.pinned,
+                }
+                for key, entry in self._entries.items()
+            ]
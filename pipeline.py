@@ -0,0 +1,405 @@
+"""
+Pipeline de transcription et diarisation
+Indépendant de Flask: utilisé par /process et par la file de tâches
+"""
+
+import inspect
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+from audio_loader import duration, load_audio, to_pyannote
+from language_policy import LanguagePolicy
+from result_model import build_segments, speaker_stats
+from speaker_merge import SpeakerTurns, assign_speakers, assign_words
+from voiceprints import speaker_embedder, speaker_embeddings
+
+# À incrémenter quand le format du résultat change (invalide le cache)
+RESULT_FORMAT_VERSION = 2
+
+# Étapes du pipeline et part (en %) de la progression totale qui leur revient
+STAGES = (
+    ("decode", 5),
+    ("transcribe", 55),
+    ("diarize", 35),
+    ("merge", 5),
+)
+
+
+class StageAborted(Exception):
+    """Levée dans une étape concurrente quand le traitement auquel elle sert a échoué ou a été abandonné"""
+
+
+def _noop_progress(stage, percent):
+    pass
+
+
+def stoppable(progress, stop):
+    """Progression qui interrompt l'étape (StageAborted) dès que l'évènement `stop` est levé"""
+    def report(stage, percent):
+        if stop.is_set():
+            raise StageAborted()
+        progress(stage, percent)
+    return report
+
+
+def stage_percent(stage, fraction=0.0):
+    """Convertit l'avancement d'une étape (0..1) en pourcentage global"""
+    done = 0
+    for name, weight in STAGES:
+        if name == stage:
+            return done + weight * min(max(fraction, 0.0), 1.0)
+        done += weight
+    return done
+
+
+def _diarize(diarization_pipeline, audio, progress):
+    """Lance pyannote en relayant sa progression interne quand le hook est supporté"""
+    if "hook" not in inspect.signature(diarization_pipeline.apply).parameters:
+        return diarization_pipeline(audio)
+
+    def hook(step_name, step_artifact, file=None, total=None, completed=None):
+        if total and completed is not None:
+            progress("diarize", stage_percent("diarize", completed / total))
+
+    return diarization_pipeline(audio, hook=hook)
+
+
+# Nombre de threads torch du processus, relevé avant le premier budget d'étape
+_process_threads = None
+_process_threads_lock = threading.Lock()
+
+
+@contextmanager
+def torch_threads(count):
+    """
+    Limite le nombre de threads torch pendant une étape. Le réglage n'est pas
+    propre au thread courant: les threads créés ensuite partent de la dernière
+    valeur fixée. À la sortie, c'est donc le nombre du processus (celui d'avant
+    toute étape) qui est rétabli, et non la valeur lue dans un thread d'étape
+    dont une étape concurrente a déjà réduit le budget.
+    """
+    if not count:
+        yield
+        return
+    import torch
+
+    global _process_threads
+    with _process_threads_lock:
+        if _process_threads is None:
+            _process_threads = torch.get_num_threads()
+        default = _process_threads
+    torch.set_num_threads(count)
+    try:
+        yield
+    finally:
+        torch.set_num_threads(default)
+
+
+def transcribe_stage(
+    whisper_model, audio, language_policy, progress, threads=None, long_audio=None, word_timestamps=False,
+):
+    """Choix de la langue puis transcription Whisper unique; retourne (résultat, langue, durée)"""
+    with torch_threads(threads):
+        progress("transcribe", stage_percent("transcribe"))
+        t0 = time.perf_counter()
+        # Langue décidée sur quelques fenêtres échantillonnées (français par défaut)
+        language_info = language_policy.decide(whisper_model, audio)
+        print(f"🌍 Langue: {language_info['language']} ({language_info['reason']}, détectée: {language_info['detected']})")
+
+        # Enregistrements longs: morceaux transcrits en parallèle par plusieurs processus
+        transcriber = whisper_model
+        if long_audio is not None and long_audio.applies_to(audio):
+            transcriber = long_audio
+        language_info["chunked"] = transcriber is long_audio
+
+        print("📝 Transcription...")
+        t1 = time.perf_counter()
+        options = {"word_timestamps": True} if word_timestamps else {}
+        result = transcriber.transcribe(audio, language=language_info["language"], **options)
+        language_info["transcribe_seconds"] = round(time.perf_counter() - t1, 3)
+        # Passe économisée par rapport à l'ancienne transcription auto-détectée puis refaite
+        language_info["saved_pass_seconds"] = (
+            language_info["transcribe_seconds"] if language_info["reason"] == "fallback" else 0.0
+        )
+        return result, language_info, time.perf_counter() - t0
+
+
+def diarize_stage(diarization_pipeline, audio, progress, threads=None):
+    """Diarisation pyannote (si disponible); retourne (annotation, durée)"""
+    progress("diarize", stage_percent("diarize"))
+    if not diarization_pipeline:
+        print("⚠️ Diarisation non disponible - attribution automatique")
+        return None, 0.0
+
+    with torch_threads(threads):
+        print("👥 Identification des locuteurs...")
+        t0 = time.perf_counter()
+        diarization = _diarize(diarization_pipeline, to_pyannote(audio), progress)
+        return diarization, time.perf_counter() - t0
+
+
+def identify_speakers(speakers, audio, turns, diarization_pipeline, voiceprints, source=None, threads=None):
+    """
+    Empreinte vocale de chaque locuteur diarisé, reconnue dans l'index
+    `voiceprints` puis ajoutée; chaque entrée de `speakers` reçoit sa ligne
+    d'index (`voiceprint`) et la similarité avec l'empreinte reconnue.
+    """
+    embed = speaker_embedder(diarization_pipeline)
+    if embed is None:
+        print("⚠️ Modèle d'empreintes indisponible: locuteurs non identifiés")
+        return
+    with torch_threads(threads):
+        embeddings = speaker_embeddings(audio, turns, embed)
+    if not embeddings:
+        return
+    indices = list(embeddings)
+    matches = voiceprints.identify(np.stack([embeddings[k] for k in indices]), source=source)
+    by_label = {turns.labels[k]: match for k, match in zip(indices, matches)}
+    for speaker in speakers:
+        match = by_label.get(speaker["label"])
+        if match is None:
+            continue
+        speaker["voiceprint"] = match["voiceprint"]
+        speaker["similarity"] = match["similarity"]
+        if match["name"]:
+            print(f"🔖 {speaker['label']} reconnu: {match['name']} (similarité {match['similarity']:.2f})")
+
+
+def turns_to_lists(turns):
+    """Tours de parole sérialisables: [[début, fin, locuteur], ...]"""
+    return [
+        [float(start), float(end), turns.labels[k]]
+        for start, end, k in zip(turns.starts, turns.ends, turns.speaker_ids)
+    ]
+
+
+def label_segments(turns, starts, ends, first_index=0, assignment=None):
+    """
+    Locuteur et indicateur de parole superposée pour chaque segment.
+    `first_index` est l'indice global du premier segment (mode stéréo sans diarisation).
+    `assignment` fournit une attribution déjà calculée (par exemple mot à mot).
+    """
+    if turns is None:
+        # Sans diarisation: mode stéréo (2 locuteurs)
+        labels = [f"SPEAKER_{(first_index + i) % 2:02d}" for i in range(len(starts))]
+        return labels, [False] * len(starts)
+
+    # Attribution par recouvrement maximal, en un seul passage vectorisé
+    if assignment is None:
+        assignment = assign_speakers(turns, starts, ends)
+    overlaps = [bool(n > 1) for n in assignment["overlapping"]]
+
+    # Si vraiment 1 seul locuteur détecté, renommer
+    if turns.num_speakers == 1:
+        return ["ORATEUR_PRINCIPAL"] * len(starts), overlaps
+
+    labels = [
+        turns.labels[k] if k >= 0 else "Locuteur_Inconnu"
+        for k in assignment["speaker_ids"]
+    ]
+    return labels, overlaps
+
+
+def split_by_words(whisper_segments, turns):
+    """
+    Re-découpe les segments aux changements de locuteur, mot à mot.
+
+    Chaque mot (timestamps Whisper) reçoit le locuteur qui le recouvre le plus;
+    les segments sans mots sont traités comme un seul mot. Retourne les
+    nouveaux segments et leur attribution (pour label_segments).
+    """
+    words, segment_ids = [], []
+    for i, seg in enumerate(whisper_segments):
+        seg_words = seg.get("words") or [{"word": seg["text"], "start": seg["start"], "end": seg["end"]}]
+        words.extend(seg_words)
+        segment_ids.extend([i] * len(seg_words))
+    if not words:
+        return whisper_segments, None
+
+    alignment = assign_words(
+        turns, [w["start"] for w in words], [w["end"] for w in words], segment_ids
+    )
+    run_starts = alignment["run_starts"]
+    bounds = list(run_starts) + [len(words)]
+    pieces = [
+        {
+            "start": words[first]["start"],
+            "end": words[last - 1]["end"],
+            "text": "".join(w["word"] for w in words[first:last]),
+        }
+        for first, last in zip(bounds[:-1], bounds[1:])
+    ]
+    assignment = {
+        "speaker_ids": alignment["speaker_ids"][run_starts],
+        "overlapping": np.maximum.reduceat(alignment["overlapping"], run_starts),
+    }
+    return pieces, assignment
+
+
+def speaker_segments(whisper_segments, turns, assignment=None):
+    """Segments en colonnes annotés de leur locuteur et de la parole superposée; retourne (segments, locuteurs)"""
+    # Détection du nombre de locuteurs basée sur la diarisation
+    # (les tours sont matérialisés une seule fois en tableaux triés)
+    if turns is not None:
+        if turns.num_speakers == 1:
+            print(f"🎤 MONO-LOCUTEUR détecté: {turns.labels[0]}")
+        else:
+            print(f"👥 {turns.num_speakers} LOCUTEURS détectés: {turns.labels}")
+    else:
+        # Sans diarisation, on assume 2 locuteurs (stéréo)
+        print("👥 Mode STÉRÉO: 2 locuteurs assumés (pas de diarisation)")
+
+    labels, overlaps = label_segments(
+        turns,
+        [seg["start"] for seg in whisper_segments],
+        [seg["end"] for seg in whisper_segments],
+        assignment=assignment,
+    )
+    print(f"🔀 {sum(overlaps)} segments avec parole superposée")
+    return build_segments(whisper_segments, labels, overlaps)
+
+
+def analyze_speakers(segments, speakers):
+    """Analyse par locuteur (temps de parole, nombre de segments) en un seul passage"""
+    return {
+        'format': RESULT_FORMAT_VERSION,
+        'speakers': speaker_stats(segments, speakers),
+        'segments': segments,
+    }
+
+
+def merge_results(whisper_segments, turns, assignment=None):
+    """Fusionne segments Whisper et tours de parole: segments en colonnes et analyse par locuteur"""
+    return analyze_speakers(*speaker_segments(whisper_segments, turns, assignment))
+
+
+def run_pipeline(
+    filepath, whisper_model, diarization_pipeline, progress=None, audio_cache=None, language_policy=None,
+    intermediates=None, parallel=False, thread_budgets=None, long_audio=None, word_speakers=False,
+    voiceprints=None,
+):
+    """
+    Transcrit et diarise un fichier audio.
+
+    Le fichier est décodé une seule fois (voir audio_loader) et le même buffer
+    est donné à Whisper et à pyannote; `audio_cache` active le cache mappé en
+    mémoire pour les gros fichiers.
+
+    `language_policy` (LanguagePolicy) choisit la langue avant l'unique
+    transcription. Si `intermediates` est un dict, il reçoit les segments
+    Whisper bruts et les tours de diarisation.
+
+    Avec `parallel`, transcription et diarisation tournent simultanément et ne
+    se rejoignent qu'à la fusion; `thread_budgets` ({"transcribe": n,
+    "diarize": m}) fixe le nombre de threads torch de chaque étape.
+
+    `long_audio` (ChunkedTranscriber) prend le relais de `whisper_model` pour
+    les enregistrements plus longs que son seuil.
+
+    Avec `word_speakers`, Whisper fournit les timestamps des mots: chaque mot
+    est attribué à un locuteur et les segments sont re-découpés aux
+    changements de locuteur.
+
+    Avec `voiceprints` (VoiceprintIndex), chaque locuteur diarisé est comparé
+    aux empreintes connues puis ajouté à l'index.
+
+    `progress(stage, percent)` est appelé au début de chaque étape et pendant la
+    diarisation; il peut lever une exception pour interrompre le traitement.
+    """
+    progress = progress or _noop_progress
+    language_policy = language_policy or LanguagePolicy()
+
+    print(f"🎵 Traitement de {filepath}...")
+
+    thread_budgets = thread_budgets or {}
+    timings = {}
+    pipeline_start = time.perf_counter()
+
+    # 0. Décodage unique en float32 mono 16 kHz
+    progress("decode", stage_percent("decode"))
+    t0 = time.perf_counter()
+    audio = load_audio(filepath, cache_dir=audio_cache)
+    timings["decode"] = time.perf_counter() - t0
+    print(f"🎧 Audio décodé: {duration(audio):.1f} s")
+
+    # 1 + 2. Transcription et diarisation, en parallèle ou l'une après l'autre
+    wall_start = time.perf_counter()
+    if parallel and diarization_pipeline:
+        print("⚡ Transcription et diarisation en parallèle")
+        stop = threading.Event()
+        with ThreadPoolExecutor(max_workers=2, thread_name_prefix="stage") as executor:
+            transcription = executor.submit(
+                transcribe_stage, whisper_model, audio, language_policy, progress,
+                thread_budgets.get("transcribe"), long_audio, word_speakers,
+            )
+            # La diarisation signale sa propre étape et s'arrête si la transcription échoue
+            diarization_future = executor.submit(
+                diarize_stage, diarization_pipeline, audio, stoppable(progress, stop), thread_budgets.get("diarize"),
+            )
+            try:
+                result, language_info, timings["transcribe"] = transcription.result()
+            except BaseException:
+                # La diarisation s'arrête à son prochain point de progression; la
+                # sortie du bloc attend qu'elle soit vraiment finie (le modèle reste occupé jusque-là)
+                stop.set()
+                raise
+            diarization, timings["diarize"] = diarization_future.result()
+    else:
+        result, language_info, timings["transcribe"] = transcribe_stage(
+            whisper_model, audio, language_policy, progress, thread_budgets.get("transcribe"), long_audio,
+            word_speakers,
+        )
+        diarization, timings["diarize"] = diarize_stage(
+            diarization_pipeline, audio, progress, thread_budgets.get("diarize")
+        )
+    timings["transcribe_diarize_wall"] = time.perf_counter() - wall_start
+
+    if intermediates is not None:
+        intermediates["segments"] = [
+            {"start": seg["start"], "end": seg["end"], "text": seg["text"]}
+            | ({"words": seg["words"]} if seg.get("words") else {})
+            for seg in result["segments"]
+        ]
+
+    # 3. Fusion des résultats
+    progress("merge", stage_percent("merge"))
+    print("🔗 Fusion des données...")
+    merge_start = time.perf_counter()
+    turns = SpeakerTurns.from_annotation(diarization) if diarization else None
+    if turns is not None and intermediates is not None:
+        intermediates["turns"] = turns_to_lists(turns)
+    whisper_segments, assignment = result["segments"], None
+    if word_speakers and turns is not None:
+        whisper_segments, assignment = split_by_words(whisper_segments, turns)
+        print(f"✂️ {len(whisper_segments) - len(result['segments'])} découpes aux changements de locuteur")
+    segments, speakers = speaker_segments(whisper_segments, turns, assignment)
+    timings["merge"] = time.perf_counter() - merge_start
+
+    analysis_start = time.perf_counter()
+    merged = analyze_speakers(segments, speakers)
+    timings["speaker_analysis"] = time.perf_counter() - analysis_start
+
+    if voiceprints is not None and turns is not None:
+        voiceprint_start = time.perf_counter()
+        identify_speakers(
+            merged["speakers"], audio, turns, diarization_pipeline, voiceprints,
+            source=Path(filepath).name, threads=thread_budgets.get("diarize"),
+        )
+        timings["voiceprints"] = time.perf_counter() - voiceprint_start
+    timings["total"] = time.perf_counter() - pipeline_start
+    print(f"✅ Traitement terminé en {timings['total']:.1f} s!")
+
+    return {
+        **merged,
+        'language': language_info,
+        'timings': {
+            'mode': 'parallel' if parallel and diarization_pipeline else 'sequential',
+            'audio_seconds': round(duration(audio), 3),
+            **{stage: round(seconds, 3) for stage, seconds in timings.items()}
+        }
+    }
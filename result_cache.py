@@ -0,0 +1,152 @@
+"""
+Cache de résultats adressé par contenu
+Clé = SHA-256 de l'audio + paramètres des modèles; stockage JSON sur disque,
+éviction LRU sous un budget de taille et fusion des calculs concurrents
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from pathlib import Path
+
+
+def make_key(audio_digest, **settings):
+    """Combine l'empreinte audio et les paramètres qui influencent le résultat"""
+    payload = json.dumps(settings, sort_keys=True, default=str)
+    return hashlib.sha256(f"{audio_digest}|{payload}".encode()).hexdigest()
+
+
+class ResultCache:
+    """
+    Résultats finaux (et optionnellement segments Whisper / tours de diarisation)
+    stockés sous `root/<2 premiers caractères>/<clé>.*.json`.
+
+    L'index LRU est propre au processus: une clé absente de l'index est
+    cherchée sur disque, où un autre processus partageant `root` a pu l'écrire.
+    """
+
+    def __init__(self, root, max_bytes=2 * 1024 ** 3, store_intermediates=False):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.store_intermediates = store_intermediates
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._entries = OrderedDict()
+        self._total = 0
+        self._load_index()
+
+    def _load_index(self):
+        """Reconstruit l'ordre LRU à partir des dates de modification sur disque"""
+        sizes = {}
+        mtimes = {}
+        for path in self.root.glob("*/*.json"):
+            key = path.name.split(".", 1)[0]
+            stat = path.stat()
+            sizes[key] = sizes.get(key, 0) + stat.st_size
+            mtimes[key] = max(mtimes.get(key, 0), stat.st_mtime)
+        for key in sorted(sizes, key=mtimes.get):
+            self._entries[key] = sizes[key]
+            self._total += sizes[key]
+
+    def _path(self, key, kind="result"):
+        return self.root / key[:2] / f"{key}.{kind}.json"
+
+    def _files(self, key):
+        return list((self.root / key[:2]).glob(f"{key}.*.json"))
+
+    def get(self, key, kind="result"):
+        with self._lock:
+            known = key in self._entries
+            if known:
+                self._entries.move_to_end(key)
+        if not known and not key.isalnum():
+            # Clé venue d'une URL: jamais de chemin arbitraire
+            return None
+        path = self._path(key, kind)
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            if known and kind == "result":
+                # Évincée par un autre processus
+                with self._lock:
+                    self._total -= self._entries.pop(key, 0)
+            return None
+        if not known:
+            try:
+                size = sum(p.stat().st_size for p in self._files(key))
+            except OSError:
+                return data
+            with self._lock:
+                if key not in self._entries:
+                    self._entries[key] = size
+                    self._total += size
+                    self._evict()
+        return data
+
+    def put(self, key, result, intermediates=None):
+        files = {"result": result}
+        if self.store_intermediates and intermediates:
+            files.update(intermediates)
+
+        self._path(key).parent.mkdir(exist_ok=True)
+        size = 0
+        for kind, data in files.items():
+            path = self._path(key, kind)
+            tmp_path = path.with_suffix(f".tmp{os.getpid()}-{threading.get_ident()}")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp_path, path)
+            size += path.stat().st_size
+
+        with self._lock:
+            self._total += size - self._entries.pop(key, 0)
+            self._entries[key] = size
+            self._evict()
+
+    def _evict(self):
+        """Supprime les entrées les moins récemment utilisées au-delà du budget"""
+        while self._total > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            self._total -= size
+            for path in self._files(key):
+                path.unlink(missing_ok=True)
+            print(f"🧹 Cache: entrée {key[:12]} évincée")
+
+    def get_or_compute(self, key, compute):
+        """
+        Retourne (résultat, hit). Les requêtes concurrentes sur une même clé
+        attendent l'unique calcul en cours au lieu de le relancer.
+        `compute()` retourne (résultat, intermédiaires).
+        """
+        cached = self.get(key)
+        if cached is not None:
+            return cached, True
+
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+
+        if not owner:
+            print(f"⏳ Cache: calcul déjà en cours pour {key[:12]}, en attente")
+            return future.result(), True
+
+        try:
+            result, intermediates = compute()
+            self.put(key, result, intermediates)
+            future.set_result(result)
+            return result, False
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
@@ -0,0 +1,94 @@
+"""
+Modèle de résultat compact
+Segments en colonnes (secondes flottantes, indice du locuteur), statistiques
+par locuteur calculées en un seul passage et pagination des segments; le
+transcript texte est produit à la demande
+"""
+
+from datetime import timedelta
+
+import numpy as np
+
+# Précision des temps dans le résultat (secondes)
+TIME_DECIMALS = 3
+
+COLUMNS = ("start", "end", "text", "speaker", "overlap")
+
+
+def build_segments(whisper_segments, labels, overlaps):
+    """
+    Segments en colonnes et liste des locuteurs.
+    Les locuteurs sont numérotés dans l'ordre de leur première prise de parole.
+    """
+    speakers = []
+    index = {}
+    speaker_ids = []
+    for label in labels:
+        if label not in index:
+            index[label] = len(speakers)
+            speakers.append(label)
+        speaker_ids.append(index[label])
+
+    segments = {
+        "start": [round(float(seg["start"]), TIME_DECIMALS) for seg in whisper_segments],
+        "end": [round(float(seg["end"]), TIME_DECIMALS) for seg in whisper_segments],
+        "text": [seg["text"].strip() for seg in whisper_segments],
+        "speaker": speaker_ids,
+        "overlap": [bool(o) for o in overlaps],
+    }
+    return segments, speakers
+
+
+def speaker_stats(segments, speakers):
+    """Temps de parole et nombre de segments par locuteur (un seul passage vectorisé)"""
+    speaker_ids = np.asarray(segments["speaker"], dtype=np.int64)
+    lengths = np.asarray(segments["end"], dtype=np.float64) - np.asarray(segments["start"], dtype=np.float64)
+    durations = np.bincount(speaker_ids, weights=lengths, minlength=len(speakers))
+    counts = np.bincount(speaker_ids, minlength=len(speakers))
+    return [
+        {"label": label, "total_duration": round(float(duration), TIME_DECIMALS), "segments": int(count)}
+        for label, duration, count in zip(speakers, durations, counts)
+    ]
+
+
+def num_segments(result):
+    return len(result["segments"]["start"])
+
+
+def page(result, offset=0, limit=None):
+    """Copie du résultat limitée aux segments [offset, offset + limit)"""
+    total = num_segments(result)
+    end = total if limit is None else min(offset + limit, total)
+    paged = {**result, "segments": {name: result["segments"][name][offset:end] for name in COLUMNS}}
+    paged["segments_total"] = total
+    paged["segments_offset"] = offset
+    paged["next_offset"] = end if end < total else None
+    return paged
+
+
+def iter_segments(result, offset=0, limit=None):
+    """Segments sous forme de dicts (rejeu en flux, export)"""
+    columns = result["segments"]
+    labels = [speaker["label"] for speaker in result["speakers"]]
+    end = num_segments(result) if limit is None else min(offset + limit, num_segments(result))
+    for i in range(offset, end):
+        yield {
+            "id": i,
+            "start": columns["start"][i],
+            "end": columns["end"][i],
+            "text": columns["text"][i],
+            "speaker": labels[columns["speaker"][i]],
+            "overlap": columns["overlap"][i],
+        }
+
+
+def format_time(seconds):
+    return str(timedelta(seconds=int(seconds)))
+
+
+def transcript(result):
+    """Transcript complet: une ligne « [début - fin] locuteur: texte » par segment"""
+    return "\n".join(
+        f"[{format_time(seg['start'])} - {format_time(seg['end'])}] {seg['speaker']}: {seg['text']}"
+        for seg in iter_segments(result)
+    )
@@ -0,0 +1,149 @@
+"""
+Service multi-processus
+Places d'inférence avec refus immédiat (429 + Retry-After) quand elles sont
+toutes prises, préparation du processus maître avant le fork des workers et
+épinglage de chaque worker sur sa part des cœurs
+"""
+
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+class SlotsFull(Exception):
+    """Levée quand aucune place d'inférence n'est libre"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Serveur occupé, réessayez dans {retry_after} s")
+        self.retry_after = retry_after
+
+
+class InferenceSlots:
+    """
+    `slots` traitements simultanés au plus dans ce processus.
+
+    La durée moyenne d'occupation (moyenne glissante) et l'âge des traitements
+    en cours donnent l'estimation renvoyée dans Retry-After.
+    """
+
+    def __init__(self, slots=1, default_seconds=30.0, smoothing=0.2):
+        self.slots = slots
+        self.default_seconds = default_seconds
+        self.smoothing = smoothing
+        self._semaphore = threading.BoundedSemaphore(slots)
+        self._lock = threading.Lock()
+        self._started = {}
+        self._mean_seconds = None
+
+    @property
+    def busy(self):
+        with self._lock:
+            return len(self._started)
+
+    def retry_after(self, waiting=0):
+        """Secondes avant qu'une place se libère, `waiting` traitements attendant déjà leur tour"""
+        with self._lock:
+            mean = self._mean_seconds or self.default_seconds
+            elapsed = max((time.monotonic() - t for t in self._started.values()), default=0.0)
+            busy = len(self._started)
+        first_free = max(mean - elapsed, 1.0) if busy >= self.slots else 0.0
+        return max(1, min(3600, math.ceil(first_free + waiting * mean / self.slots)))
+
+    def _enter(self):
+        token = object()
+        with self._lock:
+            self._started[token] = time.monotonic()
+        return token
+
+    def _exit(self, token):
+        with self._lock:
+            seconds = time.monotonic() - self._started.pop(token)
+            if self._mean_seconds is None:
+                self._mean_seconds = seconds
+            else:
+                self._mean_seconds += self.smoothing * (seconds - self._mean_seconds)
+        self._semaphore.release()
+
+    def try_acquire(self):
+        """Jeton de la place prise, ou SlotsFull si toutes sont occupées"""
+        if not self._semaphore.acquire(blocking=False):
+            raise SlotsFull(self.retry_after())
+        return self._enter()
+
+    def release(self, token):
+        self._exit(token)
+
+    @contextmanager
+    def hold(self, blocking=True):
+        """Occupe une place pendant le bloc `with` (en l'attendant, ou SlotsFull sans `blocking`)"""
+        if blocking:
+            self._semaphore.acquire()
+            token = self._enter()
+        else:
+            token = self.try_acquire()
+        try:
+            yield
+        finally:
+            self._exit(token)
+
+
+def available_cpus():
+    """Cœurs utilisables par ce processus (affinité comprise)"""
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        return list(range(os.cpu_count() or 1))
+
+
+def prepare_master():
+    """
+    À appeler avant de charger les modèles dans le processus maître: un seul
+    thread torch, pour qu'aucun pool OpenMP n'existe au moment du fork (les
+    enfants d'un processus qui en a démarré un peuvent se bloquer).
+    Retourne False si le préchargement est impossible: un contexte CUDA ne
+    survit pas au fork, chaque worker charge alors ses propres modèles.
+    """
+    try:
+        import torch
+    except ImportError:
+        return True
+    if torch.cuda.is_available():
+        print("⚠️ CUDA disponible: pas de préchargement, chaque worker charge ses modèles sur le GPU")
+        return False
+    torch.set_num_threads(1)
+    return True
+
+
+def worker_cpus(index, workers, cpus=None):
+    """Part des cœurs du worker `index` sur `workers` (au moins un cœur chacun)"""
+    cpus = cpus or available_cpus()
+    index %= workers
+    if workers >= len(cpus):
+        return [cpus[index % len(cpus)]]
+    share = len(cpus) // workers
+    start = index * share
+    # Le dernier worker prend aussi les cœurs restants
+    return cpus[start:] if index == workers - 1 else cpus[start:start + share]
+
+
+def pin_worker(index, workers, affinity=True):
+    """
+    Ajuste les threads torch du processus courant à sa part des cœurs et,
+    avec `affinity`, l'épingle sur ces cœurs
+    """
+    cpus = worker_cpus(index, workers)
+    if affinity:
+        try:
+            os.sched_setaffinity(0, cpus)
+        except (AttributeError, OSError):
+            pass
+    try:
+        import torch
+
+        torch.set_num_threads(len(cpus))
+    except ImportError:
+        pass
+    print(f"📌 Worker {os.getpid()} ({index + 1}/{workers}): cœurs {cpus}")
+    return cpus
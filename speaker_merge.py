@@ -0,0 +1,182 @@
+"""
+Moteur de fusion transcription / diarisation
+Attribue un locuteur à chaque segment Whisper, ou à chaque mot, par
+recouvrement maximal
+"""
+
+import numpy as np
+
+
+class SpeakerTurns:
+    """Tours de parole matérialisés une seule fois en tableaux NumPy triés"""
+
+    def __init__(self, starts, ends, speaker_ids, labels):
+        starts = np.asarray(starts, dtype=np.float64)
+        ends = np.asarray(ends, dtype=np.float64)
+        speaker_ids = np.asarray(speaker_ids, dtype=np.int32)
+
+        order = np.argsort(starts, kind="stable")
+        self.starts = starts[order]
+        self.ends = ends[order]
+        self.speaker_ids = speaker_ids[order]
+        self.labels = list(labels)
+        self._coverage = None
+
+    @classmethod
+    def from_annotation(cls, diarization):
+        """Construit les tableaux à partir d'une annotation pyannote (un seul parcours)"""
+        starts, ends, names = [], [], []
+        for turn, _, speaker in diarization.itertracks(yield_label=True):
+            starts.append(turn.start)
+            ends.append(turn.end)
+            names.append(speaker)
+        return cls.from_lists(starts, ends, names)
+
+    @classmethod
+    def from_lists(cls, starts, ends, names):
+        """Construit les tableaux à partir de listes (début, fin, nom du locuteur)"""
+        labels = sorted(set(names))
+        index = {label: i for i, label in enumerate(labels)}
+        speaker_ids = [index[name] for name in names]
+        return cls(starts, ends, speaker_ids, labels)
+
+    def __len__(self):
+        return len(self.starts)
+
+    @property
+    def num_speakers(self):
+        return len(self.labels)
+
+    def coverage(self):
+        """
+        Pour chaque locuteur: intervalles fusionnés (disjoints, triés) et
+        durée cumulée avant chaque intervalle. Calculé une fois puis mis en cache.
+        """
+        if self._coverage is None:
+            self._coverage = [
+                _merge_intervals(self.starts[self.speaker_ids == k], self.ends[self.speaker_ids == k])
+                for k in range(self.num_speakers)
+            ]
+        return self._coverage
+
+
+def _merge_intervals(starts, ends):
+    """Fusionne des intervalles triés par début; retourne (débuts, fins, cumul)"""
+    if len(starts) == 0:
+        empty = np.empty(0, dtype=np.float64)
+        return empty, empty, empty
+
+    # Un nouvel intervalle commence quand son début dépasse la fin maximale précédente
+    running_end = np.maximum.accumulate(ends)
+    new_group = np.empty(len(starts), dtype=bool)
+    new_group[0] = True
+    new_group[1:] = starts[1:] > running_end[:-1]
+    group_idx = np.flatnonzero(new_group)
+
+    merged_starts = starts[group_idx]
+    merged_ends = np.maximum.reduceat(ends, group_idx)
+    lengths = merged_ends - merged_starts
+    cumulative = np.concatenate(([0.0], np.cumsum(lengths)[:-1]))
+    return merged_starts, merged_ends, cumulative
+
+
+def _covered_before(t, merged_starts, merged_ends, cumulative):
+    """Durée couverte par les intervalles fusionnés dans ]-inf, t] (vectorisé)"""
+    if len(merged_starts) == 0:
+        return np.zeros_like(t)
+    i = np.searchsorted(merged_starts, t, side="right") - 1
+    valid = i >= 0
+    i = np.clip(i, 0, None)
+    partial = np.minimum(t, merged_ends[i]) - merged_starts[i]
+    return np.where(valid, cumulative[i] + partial, 0.0)
+
+
+def assign_speakers(turns, seg_starts, seg_ends, overlap_ratio=0.2):
+    """
+    Attribue à chaque segment le locuteur qui le recouvre le plus longtemps.
+
+    Retourne un dict de tableaux:
+      - speaker_ids: indice du locuteur dans turns.labels (-1 si aucun recouvrement);
+        un segment de durée nulle prend le locuteur du tour qui le contient et
+        commence le plus tôt
+      - overlap: durée de recouvrement du locuteur retenu (secondes)
+      - overlapping: nombre de locuteurs couvrant au moins `overlap_ratio`
+        du segment (>= 2 => parole superposée)
+    """
+    seg_starts = np.asarray(seg_starts, dtype=np.float64)
+    seg_ends = np.asarray(seg_ends, dtype=np.float64)
+    n = len(seg_starts)
+
+    best_ids = np.full(n, -1, dtype=np.int32)
+    best_overlap = np.zeros(n, dtype=np.float64)
+    overlapping = np.zeros(n, dtype=np.int32)
+    if n == 0 or len(turns) == 0:
+        return {"speaker_ids": best_ids, "overlap": best_overlap, "overlapping": overlapping}
+
+    # Évite un seuil nul pour les segments de durée nulle
+    points = seg_ends <= seg_starts
+    point_turn_start = np.full(n, np.inf)
+    seg_len = np.maximum(seg_ends - seg_starts, 1e-6)
+    threshold = overlap_ratio * seg_len
+
+    for k, (m_starts, m_ends, cumulative) in enumerate(turns.coverage()):
+        covered = (
+            _covered_before(seg_ends, m_starts, m_ends, cumulative)
+            - _covered_before(seg_starts, m_starts, m_ends, cumulative)
+        )
+        better = covered > best_overlap
+        best_ids[better] = k
+        best_overlap[better] = covered[better]
+        overlapping += (covered > 0) & (covered >= threshold)
+
+        if points.any() and len(m_starts):
+            # Segment ponctuel: recouvrement nul, on teste l'appartenance à un tour (bornes comprises)
+            i = np.searchsorted(m_starts, seg_starts[points], side="right") - 1
+            i_valid = np.clip(i, 0, None)
+            inside = (i >= 0) & (seg_starts[points] <= m_ends[i_valid])
+            contained = np.zeros(n, dtype=bool)
+            contained[points] = inside
+            turn_start = np.full(n, np.inf)
+            turn_start[points] = m_starts[i_valid]
+            earlier = contained & (turn_start < point_turn_start)
+            best_ids[earlier] = k
+            point_turn_start[earlier] = turn_start[earlier]
+            overlapping += contained
+
+    return {"speaker_ids": best_ids, "overlap": best_overlap, "overlapping": overlapping}
+
+
+def _fill_unassigned(speaker_ids):
+    """Les mots sans recouvrement (pauses, bords de tours) prennent le locuteur du mot précédent, sinon du suivant"""
+    valid = speaker_ids >= 0
+    if valid.all() or not valid.any():
+        return speaker_ids
+    positions = np.where(valid, np.arange(len(speaker_ids)), -1)
+    previous = np.maximum.accumulate(positions)
+    filled = np.where(previous >= 0, speaker_ids[np.clip(previous, 0, None)], -1)
+    filled[:np.argmax(valid)] = speaker_ids[np.argmax(valid)]
+    return filled
+
+
+def assign_words(turns, word_starts, word_ends, segment_ids, overlap_ratio=0.2):
+    """
+    Attribue un locuteur à chaque mot puis regroupe les mots consécutifs d'un
+    même segment et d'un même locuteur en suites.
+
+    Retourne un dict de tableaux:
+      - speaker_ids: locuteur de chaque mot (-1 seulement si aucun mot n'est couvert)
+      - overlapping: nombre de locuteurs couvrant chaque mot (voir assign_speakers)
+      - run_starts: indice du premier mot de chaque suite
+    """
+    segment_ids = np.asarray(segment_ids)
+    assignment = assign_speakers(turns, word_starts, word_ends, overlap_ratio)
+    speaker_ids = _fill_unassigned(assignment["speaker_ids"])
+
+    n = len(speaker_ids)
+    change = np.ones(n, dtype=bool)
+    change[1:] = (speaker_ids[1:] != speaker_ids[:-1]) | (segment_ids[1:] != segment_ids[:-1])
+    return {
+        "speaker_ids": speaker_ids,
+        "overlapping": assignment["overlapping"],
+        "run_starts": np.flatnonzero(change),
+    }
@@ -0,0 +1,182 @@
+"""
+Restitution progressive des résultats (NDJSON)
+Les segments Whisper sont émis dès qu'une fenêtre est transcrite, la
+diarisation tourne en parallèle et les locuteurs sont mis à jour dès que
+ses tours sont disponibles
+"""
+
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from audio_loader import SAMPLE_RATE, duration, load_audio
+from chunked_transcribe import find_split_points, plan_chunks
+from language_policy import LanguagePolicy
+from pipeline import (
+    diarize_stage, identify_speakers, label_segments, merge_results, stoppable, turns_to_lists,
+)
+from result_model import TIME_DECIMALS, iter_segments
+from speaker_merge import SpeakerTurns
+
+# Contexte transmis d'une fenêtre à la suivante (initial_prompt de Whisper)
+PROMPT_CHARS = 200
+
+
+def _noop_progress(stage, percent):
+    pass
+
+
+def _segment_event(i, seg, speaker, overlap):
+    return {
+        "type": "segment",
+        "id": i,
+        "start": round(seg["start"], TIME_DECIMALS),
+        "end": round(seg["end"], TIME_DECIMALS),
+        "text": seg["text"].strip(),
+        "speaker": speaker,
+        "overlap": overlap,
+    }
+
+
+def _speaker_event(turns, whisper_segments):
+    """Locuteurs de tous les segments déjà émis, une fois la diarisation terminée"""
+    labels, overlaps = label_segments(
+        turns,
+        [seg["start"] for seg in whisper_segments],
+        [seg["end"] for seg in whisper_segments],
+    )
+    return {
+        "type": "speakers",
+        "num_speakers": turns.num_speakers if turns is not None else 0,
+        "updates": [
+            {"id": i, "speaker": speaker, "overlap": overlap}
+            for i, (speaker, overlap) in enumerate(zip(labels, overlaps))
+        ],
+    }
+
+
+def stream_pipeline(
+    filepath, whisper_model, diarization_pipeline, audio_cache=None, language_policy=None,
+    window_seconds=30, intermediates=None, voiceprints=None,
+):
+    """
+    Générateur d'évènements: meta, language, segment*, speakers, done.
+
+    La transcription avance par fenêtres d'environ `window_seconds` coupées aux
+    silences; la fin du texte précédent sert d'initial_prompt pour garder le
+    contexte d'une fenêtre à l'autre. Avec `voiceprints` (VoiceprintIndex), les
+    locuteurs du résultat final sont identifiés par leur empreinte.
+    """
+    language_policy = language_policy or LanguagePolicy()
+    t_start = time.perf_counter()
+
+    audio = load_audio(filepath, cache_dir=audio_cache)
+    yield {"type": "meta", "duration": round(duration(audio), 3)}
+
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="stream-diarize")
+    stop = threading.Event()
+    diarization_future = None
+    if diarization_pipeline:
+        diarization_future = executor.submit(
+            diarize_stage, diarization_pipeline, audio, stoppable(_noop_progress, stop)
+        )
+
+    try:
+        language_info = language_policy.decide(whisper_model, audio)
+        yield {"type": "language", **language_info}
+
+        whisper_segments = []
+        turns = None
+        diarization_pending = diarization_future is not None
+        first_text_at = None
+        prompt = None
+
+        split_points = find_split_points(audio, window_seconds, search_seconds=window_seconds / 6)
+        for start, end, _, _ in plan_chunks(audio, split_points, overlap_seconds=0):
+            offset = start / SAMPLE_RATE
+            result = whisper_model.transcribe(
+                np.array(audio[start:end]), language=language_info["language"], initial_prompt=prompt
+            )
+            new_segments = [
+                {
+                    "start": seg["start"] + offset,
+                    "end": min(seg["end"] + offset, end / SAMPLE_RATE),
+                    "text": seg["text"],
+                }
+                for seg in result["segments"]
+            ]
+            first = len(whisper_segments)
+            whisper_segments.extend(new_segments)
+
+            # Locuteurs inconnus (None) tant que la diarisation n'est pas terminée
+            if diarization_pending:
+                labels, overlaps = [None] * len(new_segments), [False] * len(new_segments)
+            else:
+                labels, overlaps = label_segments(
+                    turns,
+                    [seg["start"] for seg in new_segments],
+                    [seg["end"] for seg in new_segments],
+                    first_index=first,
+                )
+            for i, (seg, speaker, overlap) in enumerate(zip(new_segments, labels, overlaps)):
+                yield _segment_event(first + i, seg, speaker, overlap)
+
+            if new_segments and first_text_at is None:
+                first_text_at = time.perf_counter() - t_start
+                print(f"⚡ Premier texte après {first_text_at:.1f} s")
+            prompt = "".join(seg["text"] for seg in whisper_segments[-10:])[-PROMPT_CHARS:] or None
+
+            # Diarisation terminée entre deux fenêtres: mise à jour des locuteurs
+            if diarization_pending and diarization_future.done():
+                diarization, _ = diarization_future.result()
+                turns = SpeakerTurns.from_annotation(diarization) if diarization else None
+                diarization_pending = False
+                yield _speaker_event(turns, whisper_segments)
+
+        if diarization_pending:
+            diarization, _ = diarization_future.result()
+            turns = SpeakerTurns.from_annotation(diarization) if diarization else None
+            yield _speaker_event(turns, whisper_segments)
+
+        if intermediates is not None:
+            intermediates["segments"] = whisper_segments
+            if turns is not None:
+                intermediates["turns"] = turns_to_lists(turns)
+
+        result = merge_results(whisper_segments, turns)
+        if voiceprints is not None and turns is not None:
+            identify_speakers(
+                result["speakers"], audio, turns, diarization_pipeline, voiceprints, source=Path(filepath).name,
+            )
+        result["language"] = language_info
+        result["timings"] = {
+            "mode": "streaming",
+            "audio_seconds": round(duration(audio), 3),
+            "first_text": round(first_text_at or 0.0, 3),
+            "total": round(time.perf_counter() - t_start, 3),
+        }
+        print(f"✅ Traitement en flux terminé en {result['timings']['total']:.1f} s!")
+        yield {"type": "done", "result": result}
+    finally:
+        # Client déconnecté ou erreur: la diarisation en cours s'interrompt à son
+        # prochain point de progression; on attend son arrêt pour que la place
+        # d'inférence ne soit rendue qu'une fois le modèle libre
+        stop.set()
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def stream_cached(result):
+    """Rejoue un résultat en cache sous forme d'évènements"""
+    for seg in iter_segments(result):
+        yield {"type": "segment", **seg}
+    yield {"type": "done", "result": result}
+
+
+def to_ndjson(events):
+    """Sérialise les évènements, un objet JSON par ligne"""
+    for event in events:
+        yield json.dumps(event, ensure_ascii=False) + "\n"
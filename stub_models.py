@@ -0,0 +1,149 @@
+"""
+Modèles factices déterministes
+Remplacent Whisper et pyannote pour mesurer le pipeline sur CPU, sans
+téléchargement ni token Hugging Face: mêmes interfaces, segments et tours de
+parole synthétiques à des rythmes réalistes
+"""
+
+import time
+
+import numpy as np
+
+from audio_loader import SAMPLE_RATE
+
+WORDS = (
+    "alors", "donc", "voilà", "effectivement", "projet", "réunion", "question", "réponse",
+    "client", "équipe", "semaine", "prochaine", "budget", "important", "vraiment", "bien",
+)
+
+
+def _duration(audio):
+    return len(audio) / SAMPLE_RATE
+
+
+class StubWhisper:
+    """
+    Transcripteur factice compatible avec whisper_model.transcribe.
+
+    Un segment toutes les ~`segment_seconds` secondes (±30 %), environ
+    `words_per_second` mots par segment; `rtf` simule le temps de calcul
+    (0.1 = 6 s de calcul pour une minute d'audio).
+    """
+
+    def __init__(self, segment_seconds=4.0, words_per_second=2.5, rtf=0.0, language="fr", seed=0):
+        self.segment_seconds = segment_seconds
+        self.words_per_second = words_per_second
+        self.rtf = rtf
+        self.language = language
+        self.seed = seed
+        # Attributs lus par LanguagePolicy.detect
+        self.dims = type("Dims", (), {"n_mels": 80})()
+        self.device = "cpu"
+
+    def detect_language(self, mel):
+        probs = [{self.language: 0.9, "en": 0.1} for _ in range(len(mel))]
+        return None, probs
+
+    def transcribe(self, audio, language=None, word_timestamps=False, **options):
+        total = _duration(audio)
+        if self.rtf:
+            time.sleep(total * self.rtf)
+        rng = np.random.default_rng(self.seed)
+        segments = []
+        start = 0.0
+        while start < total:
+            length = self.segment_seconds * rng.uniform(0.7, 1.3)
+            end = min(start + length, total)
+            n_words = max(1, int((end - start) * self.words_per_second))
+            words = [WORDS[i] for i in rng.integers(0, len(WORDS), n_words)]
+            segment = {
+                "id": len(segments),
+                "start": round(start, 2),
+                "end": round(end, 2),
+                "text": " " + " ".join(words),
+            }
+            if word_timestamps:
+                bounds = np.linspace(start, end, n_words + 1)
+                segment["words"] = [
+                    {"word": " " + word, "start": round(a, 2), "end": round(b, 2), "probability": 0.9}
+                    for word, a, b in zip(words, bounds[:-1], bounds[1:])
+                ]
+            segments.append(segment)
+            # Courte pause entre deux segments
+            start = end + rng.uniform(0.1, 0.6)
+        return {
+            "text": "".join(seg["text"] for seg in segments),
+            "segments": segments,
+            "language": language or self.language,
+        }
+
+
+class _Segment:
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+
+
+class StubAnnotation:
+    """Sous-ensemble de pyannote.core.Annotation utilisé par le pipeline"""
+
+    def __init__(self, turns):
+        self.turns = turns
+
+    def itertracks(self, yield_label=False):
+        for i, (start, end, label) in enumerate(self.turns):
+            if yield_label:
+                yield _Segment(start, end), i, label
+            else:
+                yield _Segment(start, end), i
+
+    def labels(self):
+        return sorted({label for _, _, label in self.turns})
+
+
+class StubDiarization:
+    """
+    Diarisation factice compatible avec un Pipeline pyannote.
+
+    Tours d'environ `turn_seconds` secondes répartis entre `num_speakers`
+    locuteurs, avec une part `overlap_ratio` de tours qui empiètent sur le
+    suivant (parole superposée).
+    """
+
+    def __init__(self, num_speakers=2, turn_seconds=6.0, overlap_ratio=0.1, rtf=0.0, seed=0):
+        self.num_speakers = num_speakers
+        self.turn_seconds = turn_seconds
+        self.overlap_ratio = overlap_ratio
+        self.rtf = rtf
+        self.seed = seed
+
+    def apply(self, file, hook=None):
+        total = file["waveform"].shape[-1] / file["sample_rate"]
+        if self.rtf:
+            time.sleep(total * self.rtf)
+        rng = np.random.default_rng(self.seed)
+        turns = []
+        start, speaker = 0.0, 0
+        while start < total:
+            end = min(start + self.turn_seconds * rng.uniform(0.5, 1.5), total)
+            overlap = rng.uniform(0.5, 1.5) if rng.random() < self.overlap_ratio else 0.0
+            turns.append((round(start, 2), round(min(end + overlap, total), 2), f"SPEAKER_{speaker:02d}"))
+            if self.num_speakers > 1:
+                speaker = (speaker + int(rng.integers(1, self.num_speakers))) % self.num_speakers
+            start = end + rng.uniform(0.0, 0.4)
+        if hook:
+            hook("segmentation", None, total=1, completed=1)
+        return StubAnnotation(turns)
+
+    def __call__(self, file, hook=None):
+        return self.apply(file, hook=hook)
+
+    def embed(self, audio, bands=32):
+        """Empreinte factice: énergie logarithmique par bande de fréquence (timbre grossier)"""
+        spectrum = np.abs(np.fft.rfft(np.asarray(audio, dtype=np.float32)))
+        freqs = np.fft.rfftfreq(len(audio), 1 / SAMPLE_RATE)
+        # Bandes espacées logarithmiquement: plus de résolution dans les graves, là où les voix diffèrent
+        edges = np.searchsorted(freqs, np.geomspace(60, SAMPLE_RATE / 2, bands + 1))
+        energies = np.array([spectrum[lo:hi].mean() if hi > lo else 0.0 for lo, hi in zip(edges[:-1], edges[1:])])
+        embedding = np.log1p(energies)
+        return embedding - embedding.mean()
@@ -0,0 +1,225 @@
+"""
+Ingestion des fichiers envoyés
+Le corps multipart est écrit par blocs directement dans le dossier des
+uploads, sous un nom unique, haché au fil de l'écriture et coupé dès que la
+taille maximale est dépassée; une politique de rétention borne le disque
+"""
+
+import hashlib
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from flask import Request, current_app
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.utils import secure_filename
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: un seul processus serveur, le suivi en mémoire suffit
+    fcntl = None
+
+
+class Upload:
+    """Fichier reçu: chemin unique, empreinte SHA-256 et taille"""
+
+    def __init__(self, path, digest, size, original_name):
+        self.path = path
+        self.digest = digest
+        self.size = size
+        self.original_name = original_name
+
+
+class HashingFile:
+    """Fichier d'upload qui hache et compte les octets à l'écriture"""
+
+    def __init__(self, path, max_bytes, on_abort=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.on_abort = on_abort
+        self.size = 0
+        self.adopted = False
+        self._sha = hashlib.sha256()
+        self._file = open(path, "w+b")
+
+    def write(self, data):
+        self.size += len(data)
+        if self.max_bytes and self.size > self.max_bytes:
+            self._file.close()
+            Path(self.path).unlink(missing_ok=True)
+            if self.on_abort:
+                self.on_abort(self.path)
+            raise RequestEntityTooLarge(f"Fichier trop volumineux (max {self.max_bytes // 1024 ** 2} MB)")
+        self._sha.update(data)
+        return self._file.write(data)
+
+    @property
+    def digest(self):
+        return self._sha.hexdigest()
+
+    def __getattr__(self, name):
+        # seek, read, close... délégués au vrai fichier
+        return getattr(self._file, name)
+
+
+class UploadStore:
+    """
+    Dossier des uploads avec noms uniques et rétention:
+      - max_file_bytes: taille maximale d'un fichier
+      - retention_seconds: âge au-delà duquel un fichier est supprimé
+      - max_total_bytes: budget disque total (les plus anciens partent d'abord)
+      - delete_after_processing: supprime le fichier dès la fin du traitement
+
+    Un fichier en cours de réception ou de traitement porte un verrou partagé
+    (flock) tenu par le processus qui le traite: la rétention d'un autre
+    worker partageant le dossier ne le supprime pas.
+    """
+
+    def __init__(
+        self, root, max_file_bytes=500 * 1024 ** 2, retention_seconds=24 * 3600,
+        max_total_bytes=10 * 1024 ** 3, delete_after_processing=False,
+    ):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_file_bytes = max_file_bytes
+        self.retention_seconds = retention_seconds
+        self.max_total_bytes = max_total_bytes
+        self.delete_after_processing = delete_after_processing
+        # Chemin -> descripteur portant le verrou partagé (None sans fcntl)
+        self._active = {}
+        self._lock = threading.Lock()
+
+    def open(self, filename):
+        """
+        Fichier de destination pour un upload en cours de réception; protégé de
+        la rétention jusqu'à release(), ou jusqu'à discard() s'il n'est jamais adopté
+        """
+        suffix = Path(secure_filename(filename or "")).suffix.lower()
+        path = self.root / f"{uuid.uuid4().hex}{suffix}"
+        target = HashingFile(str(path), self.max_file_bytes, on_abort=self._forget)
+        handle = None
+        if fcntl is not None:
+            # Descripteur distinct: le verrou survit à la fermeture du flux d'écriture dans adopt()
+            handle = open(path, "rb")
+            fcntl.flock(handle, fcntl.LOCK_SH)
+        with self._lock:
+            self._active[str(path)] = handle
+        return target
+
+    def _forget(self, path):
+        with self._lock:
+            handle = self._active.pop(path, None)
+        if handle is not None:
+            handle.close()
+
+    def _remove_unused(self, path):
+        """Supprime `path` si aucun processus ne le traite; False s'il est utilisé ou déjà parti"""
+        if fcntl is None:
+            path.unlink(missing_ok=True)
+            return True
+        try:
+            with open(path, "rb") as handle:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                path.unlink(missing_ok=True)
+        except (FileNotFoundError, BlockingIOError):
+            return False
+        return True
+
+    def adopt(self, file_storage):
+        """Finalise un FileStorage reçu et retourne l'Upload correspondant"""
+        stream = file_storage.stream
+        if isinstance(stream, HashingFile):
+            stream.flush()
+            stream.adopted = True
+            upload = Upload(stream.path, stream.digest, stream.size, file_storage.filename)
+        else:
+            # Requête construite hors UploadRequest: copie par blocs en hachant
+            target = self.open(file_storage.filename)
+            for chunk in iter(lambda: stream.read(1024 * 1024), b""):
+                target.write(chunk)
+            target.close()
+            target.adopted = True
+            upload = Upload(target.path, target.digest, target.size, file_storage.filename)
+        stream.close()
+        self.prune()
+        return upload
+
+    def discard(self, file_storage):
+        """Fichier reçu mais non traité (requête refusée, champ inattendu): supprimé aussitôt"""
+        self.discard_stream(file_storage.stream)
+
+    def discard_stream(self, stream):
+        """Supprime un fichier ouvert par open() et jamais adopté (sans effet sur un upload adopté)"""
+        stream.close()
+        if isinstance(stream, HashingFile) and not stream.adopted:
+            Path(stream.path).unlink(missing_ok=True)
+            self._forget(stream.path)
+
+    def release(self, upload):
+        """Fin du traitement: le fichier peut être supprimé selon la politique"""
+        self._forget(upload.path)
+        if self.delete_after_processing:
+            Path(upload.path).unlink(missing_ok=True)
+
+    def prune(self):
+        """
+        Applique la rétention: âge maximal, puis budget disque en supprimant
+        d'abord les plus anciens; les fichiers en cours de traitement, dans ce
+        processus ou un autre, ne sont jamais supprimés.
+        """
+        with self._lock:
+            active = set(self._active)
+        files = []
+        for path in self.root.iterdir():
+            # Un prune ou une libération concurrente peut avoir supprimé le fichier entre-temps
+            try:
+                if path.is_file():
+                    stat = path.stat()
+                    files.append((stat.st_mtime, stat.st_size, path))
+            except FileNotFoundError:
+                continue
+        files.sort()
+
+        limit = time.time() - self.retention_seconds
+        total = sum(size for _, size, _ in files)
+        removed = 0
+        for mtime, size, path in files:
+            # Fichier en cours de traitement: conservé même expiré
+            if str(path) in active:
+                continue
+            if mtime >= limit and total <= self.max_total_bytes:
+                continue
+            if not self._remove_unused(path):
+                continue
+            total -= size
+            removed += 1
+        if removed:
+            print(f"🧹 Uploads: {removed} fichier(s) supprimé(s)")
+
+
+class UploadRequest(Request):
+    """
+    Requête Flask dont les fichiers sont écrits directement dans l'UploadStore
+    de l'application. À la fin de la requête, les fichiers qui n'ont pas été
+    adoptés (champ ignoré, erreur, corps tronqué ou client parti pendant la
+    réception) sont supprimés.
+    """
+
+    _upload_streams = ()
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        store = current_app.extensions.get("upload_store")
+        if store is None:
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        stream = store.open(filename)
+        # Suivi ici et non via self.files: absent si la lecture du formulaire échoue en cours de route
+        self._upload_streams = [*self._upload_streams, (store, stream)]
+        return stream
+
+    def close(self):
+        super().close()
+        for store, stream in self._upload_streams:
+            store.discard_stream(stream)
+        self._upload_streams = ()
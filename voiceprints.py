@@ -0,0 +1,373 @@
+"""
+Empreintes vocales persistantes
+Une empreinte par locuteur diarisé (modèle d'empreintes de pyannote), stockée
+dans une matrice float32 sur disque complétée par simple ajout, avec ses
+métadonnées en JSONL. Les nouveaux locuteurs sont comparés aux empreintes
+connues par similarité cosinus (produit matriciel par blocs, ou index HNSW
+approximatif si faiss est installé) et reprennent le nom du locuteur reconnu.
+Plusieurs processus serveurs peuvent partager un même index
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: un seul processus serveur, le verrou de threads suffit
+    fcntl = None
+
+import numpy as np
+
+from audio_loader import SAMPLE_RATE
+
+
+def speaker_embedder(diarization_pipeline):
+    """
+    Fonction audio float32 16 kHz -> empreinte vocale, à partir du pipeline de
+    diarisation déjà chargé (modèle d'empreintes interne de pyannote), ou None.
+    """
+    if diarization_pipeline is None:
+        return None
+    if hasattr(diarization_pipeline, "embed"):
+        # Modèles factices
+        return diarization_pipeline.embed
+    model = getattr(diarization_pipeline, "_embedding", None)
+    if model is None:
+        return None
+    import torch
+
+    def embed(audio):
+        waveform = torch.from_numpy(np.ascontiguousarray(audio, dtype=np.float32))[None, None]
+        with torch.inference_mode():
+            return np.asarray(model(waveform))[0]
+
+    return embed
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1)
+
+
+def speaker_embeddings(audio, turns, embed, max_seconds=60.0, min_turn_seconds=1.0, max_turn_seconds=10.0):
+    """
+    Empreinte de chaque locuteur des tours de diarisation: moyenne, pondérée par
+    la durée, des empreintes de ses tours les plus longs sans parole superposée
+    (au plus `max_seconds` d'audio par locuteur). Retourne {indice: vecteur normalisé}.
+    """
+    starts, ends = turns.starts, turns.ends
+    # Tours empiétant sur le précédent ou le suivant (tours triés par début)
+    previous_end = np.concatenate([[-np.inf], np.maximum.accumulate(ends)[:-1]])
+    next_start = np.concatenate([starts[1:], [np.inf]])
+    clean = (starts >= previous_end) & (ends <= next_start)
+
+    embeddings = {}
+    for k in range(turns.num_speakers):
+        mine = turns.speaker_ids == k
+        candidates = np.flatnonzero(mine & clean & (ends - starts >= min_turn_seconds))
+        if not len(candidates):
+            # Locuteur qui ne parle qu'en même temps qu'un autre ou par bribes
+            candidates = np.flatnonzero(mine)
+        candidates = candidates[np.argsort(starts[candidates] - ends[candidates], kind="stable")]
+
+        vectors, weights, total = [], [], 0.0
+        for i in candidates:
+            seconds = min(ends[i] - starts[i], max_turn_seconds)
+            chunk = audio[int(starts[i] * SAMPLE_RATE):int((starts[i] + seconds) * SAMPLE_RATE)]
+            if len(chunk) < SAMPLE_RATE // 2:
+                continue
+            vector = np.asarray(embed(np.asarray(chunk, dtype=np.float32)), dtype=np.float32).ravel()
+            if not np.all(np.isfinite(vector)):
+                continue
+            vectors.append(vector)
+            weights.append(seconds)
+            total += seconds
+            if total >= max_seconds:
+                break
+        if vectors:
+            embeddings[k] = _normalize(np.average(_normalize(vectors), axis=0, weights=weights))
+    return embeddings
+
+
+class VoiceprintIndex:
+    """
+    Index d'empreintes vocales sur disque.
+
+    `voiceprints.f32` contient les vecteurs normalisés bout à bout (une ligne
+    par locuteur et par enregistrement), `voiceprints.jsonl` les métadonnées:
+    une ligne "add" par vecteur puis des lignes "name". Chaque ligne appartient
+    à une identité (`speaker`): celle de l'empreinte reconnue à l'ajout, sinon
+    une nouvelle. Nommer une ligne nomme son identité, donc toutes ses empreintes.
+
+    Au-delà de `ann_min_rows` lignes, la recherche passe par un index HNSW
+    (faiss, optionnel) construit une fois puis complété à chaque ajout.
+
+    Les écritures se font sous un verrou de fichier (`voiceprints.lock`)
+    après relecture de la fin du journal: les lignes ajoutées par un autre
+    processus sont prises en compte avant chaque recherche et chaque ajout.
+    """
+
+    def __init__(self, root, threshold=0.6, ann_min_rows=50000, block_rows=65536, ann_ef_search=128):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.threshold = threshold
+        self.ann_min_rows = ann_min_rows
+        self.block_rows = block_rows
+        self.ann_ef_search = ann_ef_search
+        self._vectors_path = self.root / "voiceprints.f32"
+        self._meta_path = self.root / "voiceprints.jsonl"
+        self._lock_path = self.root / "voiceprints.lock"
+        self._lock = threading.Lock()
+        self.dim = None
+        self.records = []
+        self.names = {}
+        # Octets du journal déjà lus
+        self._meta_offset = 0
+        self._matrix = None
+        self._ann = None
+        self._load()
+
+    @contextmanager
+    def _exclusive(self):
+        """Verrou des threads puis du fichier; le journal est relu une fois le verrou obtenu"""
+        with self._lock:
+            if fcntl is None:
+                self._refresh()
+                yield
+                return
+            with open(self._lock_path, "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    self._refresh()
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _apply(self, line):
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            return
+        if record["op"] == "add":
+            self.dim = record["dim"]
+            self.records.append(record)
+        elif record["op"] == "name" and record["name"]:
+            self.names[record["speaker"]] = record["name"]
+        elif record["op"] == "name":
+            self.names.pop(record["speaker"], None)
+
+    def _refresh(self):
+        """Lit les lignes complètes ajoutées au journal depuis la dernière lecture"""
+        try:
+            size = self._meta_path.stat().st_size
+        except FileNotFoundError:
+            return
+        if size <= self._meta_offset:
+            return
+        with open(self._meta_path, "rb") as f:
+            f.seek(self._meta_offset)
+            data = f.read(size - self._meta_offset)
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            self._apply(line)
+        self._meta_offset += end
+
+    def _load(self):
+        with self._exclusive():
+            if not self._meta_path.exists():
+                return
+            # Dernière ligne tronquée par un arrêt brutal: retirée pour que la suite du journal reste lisible
+            if self._meta_path.stat().st_size > self._meta_offset:
+                with open(self._meta_path, "ab") as f:
+                    f.truncate(self._meta_offset)
+            # Vecteurs et métadonnées écrits séparément: après un arrêt brutal on
+            # s'en tient aux lignes complètes des deux pour que les ajouts restent alignés
+            if self.dim:
+                rows = self._vectors_path.stat().st_size // (4 * self.dim) if self._vectors_path.exists() else 0
+                rows = min(rows, len(self.records))
+                del self.records[rows:]
+                with open(self._vectors_path, "ab") as f:
+                    f.truncate(rows * 4 * self.dim)
+        print(f"🗂️ {len(self.records)} empreintes vocales chargées ({len(self.names)} locuteurs nommés)")
+
+    def __len__(self):
+        return len(self.records)
+
+    def _vectors(self):
+        """Matrice des empreintes projetée en mémoire (rouverte après ajout)"""
+        if self._matrix is None or len(self._matrix) != len(self.records):
+            self._matrix = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(len(self.records), self.dim))
+        return self._matrix
+
+    def _ann_index(self):
+        """Index HNSW (produit scalaire) si faiss est disponible et l'index assez grand, sinon None"""
+        if len(self.records) < self.ann_min_rows:
+            return None
+        built = self._ann is None
+        if built:
+            try:
+                import faiss
+            except ImportError:
+                return None
+            self._ann = faiss.IndexHNSWFlat(self.dim, 32, faiss.METRIC_INNER_PRODUCT)
+            self._ann.hnsw.efConstruction = 80
+            # Largeur d'exploration à la recherche: compromis rappel / vitesse
+            self._ann.hnsw.efSearch = self.ann_ef_search
+        # Construction, ou lignes ajoutées depuis (par ce processus ou un autre)
+        t0 = time.perf_counter()
+        for start in range(self._ann.ntotal, len(self.records), self.block_rows):
+            self._ann.add(np.ascontiguousarray(self._vectors()[start:min(start + self.block_rows, len(self.records))]))
+        if built:
+            print(f"🧭 Index approximatif construit sur {len(self.records)} empreintes en {time.perf_counter() - t0:.1f} s")
+        return self._ann
+
+    def _search(self, queries):
+        """Ligne la plus proche de chaque requête et sa similarité cosinus (-1 si l'index est vide)"""
+        best_rows = np.full(len(queries), -1, dtype=np.int64)
+        best_scores = np.full(len(queries), -np.inf, dtype=np.float32)
+        if not self.records or not len(queries):
+            return best_rows, best_scores
+        ann = self._ann_index()
+        if ann is not None:
+            scores, rows = ann.search(np.ascontiguousarray(queries), 1)
+            return rows[:, 0].astype(np.int64), scores[:, 0]
+        # Recherche exacte par blocs: mémoire bornée quelle que soit la taille de l'index
+        matrix = self._vectors()
+        for start in range(0, len(matrix), self.block_rows):
+            scores = queries @ np.asarray(matrix[start:start + self.block_rows]).T
+            rows = np.argmax(scores, axis=1)
+            block_best = scores[np.arange(len(queries)), rows]
+            better = block_best > best_scores
+            best_rows[better] = rows[better] + start
+            best_scores[better] = block_best[better]
+        return best_rows, best_scores
+
+    def search(self, vectors):
+        """[(ligne, similarité)] de l'empreinte connue la plus proche de chaque vecteur"""
+        queries = _normalize(np.atleast_2d(vectors))
+        with self._lock:
+            self._refresh()
+            rows, scores = self._search(queries)
+        return [(int(row), float(score)) for row, score in zip(rows, scores)]
+
+    def _write_meta(self, records):
+        """Ajoute des lignes au journal (sous `_exclusive`: rien n'a été écrit depuis la relecture)"""
+        with open(self._meta_path, "ab") as f:
+            f.write("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records).encode("utf-8"))
+            self._meta_offset = f.tell()
+
+    def _append(self, vectors, records):
+        # Vecteurs d'abord: une ligne du journal n'est jamais lue avant son vecteur
+        with open(self._vectors_path, "ab") as f:
+            f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        self._write_meta(records)
+        self.records.extend(records)
+
+    def add(self, vectors, source=None):
+        """Ajoute des empreintes sans les comparer, chacune sous une nouvelle identité (import en masse)"""
+        vectors = _normalize(np.atleast_2d(vectors))
+        with self._exclusive():
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            if vectors.shape[1] != self.dim:
+                raise ValueError(f"Empreintes de dimension {vectors.shape[1]}, index en dimension {self.dim}")
+            created = round(time.time(), 3)
+            rows = range(len(self.records), len(self.records) + len(vectors))
+            self._append(vectors, [
+                {"op": "add", "row": row, "speaker": row, "dim": self.dim, "source": source,
+                 "similarity": None, "created": created}
+                for row in rows
+            ])
+        return list(rows)
+
+    def identify(self, vectors, source=None):
+        """
+        Reconnaît chaque vecteur (un par locuteur d'un enregistrement) puis
+        l'ajoute à l'index. Retourne, pour chacun: ligne ajoutée, identité,
+        nom courant (ou None) et similarité avec l'empreinte reconnue.
+        """
+        queries = _normalize(np.atleast_2d(vectors))
+        with self._exclusive():
+            if self.dim is None:
+                self.dim = queries.shape[1]
+            if queries.shape[1] != self.dim:
+                raise ValueError(f"Empreintes de dimension {queries.shape[1]}, index en dimension {self.dim}")
+            rows, scores = self._search(queries)
+
+            # Deux locuteurs d'un même enregistrement ne peuvent pas être la même
+            # identité: la plus forte similarité l'emporte, l'autre devient nouvelle
+            speakers = {}
+            for i in np.argsort(-scores, kind="stable"):
+                row, score = rows[i], scores[i]
+                if row >= 0 and score >= self.threshold and self.records[row]["speaker"] not in speakers.values():
+                    speakers[i] = self.records[row]["speaker"]
+
+            matches, records = [], []
+            created = round(time.time(), 3)
+            for i, (row, score) in enumerate(zip(rows, scores)):
+                new_row = len(self.records) + i
+                known = i in speakers
+                speaker = speakers[i] if known else new_row
+                records.append({
+                    "op": "add", "row": new_row, "speaker": speaker, "dim": self.dim,
+                    "source": source, "similarity": round(float(score), 4) if known else None, "created": created,
+                })
+                matches.append({
+                    "voiceprint": new_row,
+                    "speaker": speaker,
+                    "name": self.names.get(speaker),
+                    "similarity": round(float(score), 4) if row >= 0 else None,
+                })
+            self._append(queries, records)
+        return matches
+
+    def name(self, row, name):
+        """Nomme l'identité de la ligne `row` (None ou "" efface le nom); retourne l'identité"""
+        with self._exclusive():
+            if not 0 <= row < len(self.records):
+                raise KeyError(row)
+            speaker = self.records[row]["speaker"]
+            name = name or None
+            self._write_meta([{"op": "name", "speaker": speaker, "name": name}])
+            if name:
+                self.names[speaker] = name
+            else:
+                self.names.pop(speaker, None)
+        return speaker
+
+    def name_of(self, row):
+        if row is None or not 0 <= row < len(self.records):
+            return None
+        return self.names.get(self.records[row]["speaker"])
+
+    def apply_names(self, result):
+        """Copie du résultat où les locuteurs reconnus portent leur nom courant"""
+        with self._lock:
+            self._refresh()
+        speakers = []
+        for speaker in result.get("speakers", []):
+            name = self.name_of(speaker.get("voiceprint"))
+            if name:
+                speaker = {**speaker, "label": name, "diarization_label": speaker["label"]}
+            speakers.append(speaker)
+        return {**result, "speakers": speakers}
+
+    def stats(self):
+        with self._lock:
+            self._refresh()
+            return {
+                "voiceprints": len(self.records),
+                "speakers": len({record["speaker"] for record in self.records}),
+                "named": len(self.names),
+                "dim": self.dim,
+                "threshold": self.threshold,
+                "approximate": self._ann is not None,
+            }